@@ -1,33 +1,91 @@
+import time
+PROCESS_START_TIME = time.perf_counter()
 import cv2
 import numpy as np
-import mss
+import os
 import sys
-import time
-import psutil
 import platform
 import uuid
+import json
+import threading
+import bisect
+import importlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from PySide6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
     QComboBox, QMainWindow, QSizePolicy, QListWidget, QDialog, QDialogButtonBox,
-    QListWidgetItem, QMessageBox
+    QListWidgetItem, QMessageBox, QInputDialog, QGridLayout, QSlider
 )
 from PySide6.QtCore import Qt, QTimer, Signal, QPoint, QRectF
 from PySide6.QtGui import QImage, QPixmap, QMouseEvent, QWheelEvent, QCursor
 
-if platform.system() == "Windows":
+STARTUP_TIMINGS = {"import": time.perf_counter() - PROCESS_START_TIME}
+LAZY_MODULES = {}
+
+def lazy_import(module_name):
+    module = LAZY_MODULES.get(module_name)
+    if module is None:
+        import_start_time = time.perf_counter()
+        module = importlib.import_module(module_name)
+        LAZY_MODULES[module_name] = module
+        STARTUP_TIMINGS[f"import {module_name}"] = time.perf_counter() - import_start_time
+    return module
+
+HAS_WIN32 = None
+win32gui = None
+win32process = None
+
+def load_win32():
+    global HAS_WIN32, win32gui, win32process
+    if HAS_WIN32 is not None:
+        return HAS_WIN32
+    if platform.system() != "Windows":
+        print("Ostrzeżenie: Ten system operacyjny nie jest Windows. Niektóre funkcje mogą działać nieprawidłowo lub nie być dostępne.")
+        HAS_WIN32 = False
+        return HAS_WIN32
     try:
-        import win32gui
-        import win32process
-        import win32con
+        win32gui = lazy_import("win32gui")
+        win32process = lazy_import("win32process")
         HAS_WIN32 = True
     except ImportError:
         print("Ostrzeżenie: Moduł pywin32 nie jest zainstalowany. Funkcje wykrywania okien mogą działać nieprawidłowo.")
         print("Zainstaluj: pip install pywin32")
         HAS_WIN32 = False
-else:
-    HAS_WIN32 = False
-    print("Ostrzeżenie: Ten system operacyjny nie jest Windows. Niektóre funkcje mogą działać nieprawidłowo lub nie być dostępne.")
+    return HAS_WIN32
+
+HAS_KEYBOARD = None
+keyboard = None
+
+def load_keyboard():
+    global HAS_KEYBOARD, keyboard
+    if HAS_KEYBOARD is not None:
+        return HAS_KEYBOARD
+    try:
+        keyboard = lazy_import("keyboard")
+        HAS_KEYBOARD = True
+    except ImportError:
+        print("Ostrzeżenie: Moduł keyboard nie jest zainstalowany. Globalne skróty klawiszowe scen nie będą dostępne.")
+        print("Zainstaluj: pip install keyboard")
+        HAS_KEYBOARD = False
+    return HAS_KEYBOARD
+
+HAS_MEDIAPIPE = None
+mediapipe = None
+
+def load_mediapipe():
+    global HAS_MEDIAPIPE, mediapipe
+    if HAS_MEDIAPIPE is not None:
+        return HAS_MEDIAPIPE
+    try:
+        mediapipe = lazy_import("mediapipe")
+        HAS_MEDIAPIPE = True
+    except ImportError:
+        print("Ostrzeżenie: Moduł mediapipe nie jest zainstalowany. Wycinanie tła kamery użyje wolniejszej metody GrabCut.")
+        print("Zainstaluj: pip install mediapipe")
+        HAS_MEDIAPIPE = False
+    return HAS_MEDIAPIPE
 
 PREVIEW_WINDOW_NAME = "Podgląd Kamery + Obszar Ekranu"
 DEFAULT_CAM_WIDTH = 1280
@@ -36,15 +94,172 @@ INITIAL_PREVIEW_WINDOW_WIDTH = 1280
 INITIAL_PREVIEW_WINDOW_HEIGHT = 720
 MIN_LAYER_SIZE = 10
 MAX_LAYER_SIZE = 4000
+MAX_LAYER_COORDINATE = 100000
 RESIZE_HANDLE_SIZE = 10
 MOVE_STEP = 5
+ROI_PREVIEW_FRAME_INTERVAL = 2
+ROI_PREVIEW_MAX_WIDTH = 1200
+ROI_PREVIEW_MAX_HEIGHT = 800
 SOURCE_TYPE_CAMERA = "Camera"
 SOURCE_TYPE_SCREEN_REGION = "Screen Region"
+SOURCE_TYPE_REPLAY = "Replay"
+SOURCE_TYPE_TEST_PATTERN = "Test Pattern"
+TRANSIENT_SOURCE_TYPES = (SOURCE_TYPE_REPLAY, SOURCE_TYPE_TEST_PATTERN)
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 33, 50, 75, 100, 150, 250, 500, 1000)
+SELF_TEST_BITS = 16
+SELF_TEST_CELL_SIZE = 24
+SELF_TEST_HISTORY_SIZE = 120
+SCENES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenes.json")
+SCENES_FILE_VERSION = 1
+SCENE_HOTKEY_TEMPLATE = "ctrl+alt+{}"
+MAX_SCENE_HOTKEYS = 9
+MASTER_FPS = 30
+WARM_CAMERA_DRAIN_INTERVAL = 0.005
+OUTPUT_PROFILE_PREVIEW = "preview"
+OUTPUT_PROFILE_STREAM = "stream"
+OUTPUT_PROFILE_REPLAY = "replay"
+OUTPUT_PROFILES = [
+    {"name": OUTPUT_PROFILE_PREVIEW, "width": None, "height": None, "fps": MASTER_FPS},
+    {"name": OUTPUT_PROFILE_STREAM, "width": 1280, "height": 720, "fps": 15},
+    {"name": OUTPUT_PROFILE_REPLAY, "width": 1280, "height": 720, "fps": 15},
+]
+OUTPUT_PRESENTATION_POINTS = {
+    OUTPUT_PROFILE_PREVIEW: "wyświetlenia w podglądzie",
+    OUTPUT_PROFILE_STREAM: "wysłania do pierwszego klienta",
+    OUTPUT_PROFILE_REPLAY: "zapisu w buforze powtórki",
+}
+QUALITY_LEVELS = [
+    {"name": "pełna jakość", "interpolation": cv2.INTER_AREA, "screen_capture_interval": 1,
+     "render_scale": 1.0, "preview_interval": 1},
+    {"name": "szybsza interpolacja", "interpolation": cv2.INTER_LINEAR, "screen_capture_interval": 1,
+     "render_scale": 1.0, "preview_interval": 1},
+    {"name": "rzadsze przechwytywanie ekranu", "interpolation": cv2.INTER_LINEAR, "screen_capture_interval": 2,
+     "render_scale": 1.0, "preview_interval": 1},
+    {"name": "rozdzielczość 75%", "interpolation": cv2.INTER_LINEAR, "screen_capture_interval": 2,
+     "render_scale": 0.75, "preview_interval": 1},
+    {"name": "rozdzielczość 50%", "interpolation": cv2.INTER_LINEAR, "screen_capture_interval": 3,
+     "render_scale": 0.5, "preview_interval": 1},
+    {"name": "rzadszy podgląd", "interpolation": cv2.INTER_NEAREST, "screen_capture_interval": 3,
+     "render_scale": 0.5, "preview_interval": 2},
+]
+QUALITY_SMOOTHING = 0.1
+QUALITY_DOWNGRADE_RATIO = 1.0
+QUALITY_UPGRADE_RATIO = 0.6
+QUALITY_DOWNGRADE_FRAMES = 15
+QUALITY_UPGRADE_FRAMES = 90
+QUALITY_EVENT_LOG_SIZE = 100
+ISOLATED_CAPTURE_ENABLED = False
+STREAM_BIND_ADDRESS = "0.0.0.0"
+STREAM_HTTP_PORT = 8080
+STREAM_TCP_PORT = 8081
+STREAM_JPEG_QUALITY = 80
+STREAM_ENCODER_WORKERS = 2
+STREAM_CLIENT_QUEUE_SIZE = 2
+REPLAY_RECORDING_AT_START = False
+REPLAY_SECONDS = 30
+REPLAY_MAX_MEMORY_MB = 256
+REPLAY_JPEG_QUALITY = 85
+REPLAY_ENCODER_WORKERS = 2
+REPLAY_DEFAULT_CLIP_SECONDS = 10
+REPLAY_EXPORT_FOURCC = "mp4v"
+CONTROL_API_BIND_ADDRESS = "127.0.0.1"
+CONTROL_API_PORT = 8765
+CONTROL_API_TIMEOUT = 2.0
+LAYER_UPDATE_FIELDS = ("id", "name", "x", "y", "width", "height", "visible", "z", "color", "matting")
+LAYER_Z_KEYWORDS = ("front", "back", "up", "down")
+COLOR_ADJUSTMENT_DEFAULTS = {"brightness": 0.0, "contrast": 1.0, "gamma": 1.0, "saturation": 1.0, "temperature": 0.0}
+COLOR_ADJUSTMENT_RANGES = {
+    "brightness": (-100.0, 100.0),
+    "contrast": (0.0, 3.0),
+    "gamma": (0.1, 5.0),
+    "saturation": (0.0, 3.0),
+    "temperature": (-100.0, 100.0),
+}
+COLOR_ADJUSTMENT_SLIDER_SCALE = {"brightness": 1, "contrast": 100, "gamma": 100, "saturation": 100, "temperature": 1}
+COLOR_ADJUSTMENT_LABELS = {
+    "brightness": "Jasność",
+    "contrast": "Kontrast",
+    "gamma": "Gamma",
+    "saturation": "Nasycenie",
+    "temperature": "Temperatura barwowa",
+}
+COLOR_TEMPERATURE_MAX_GAIN = 0.3
+COLOR_LUMA_WEIGHTS_BGR = (0.114, 0.587, 0.299)
+MATTING_MODE_OFF = "off"
+MATTING_MODE_BLUR = "blur"
+MATTING_MODE_REMOVE = "remove"
+MATTING_MODES = (MATTING_MODE_OFF, MATTING_MODE_BLUR, MATTING_MODE_REMOVE)
+MATTING_MODE_LABELS = {
+    MATTING_MODE_OFF: "Bez zmian",
+    MATTING_MODE_BLUR: "Rozmycie tła",
+    MATTING_MODE_REMOVE: "Usunięcie tła",
+}
+MATTING_FRAME_BUDGET_MS = 4.0
+MATTING_INPUT_WIDTH = 256
+MATTING_MIN_INPUT_WIDTH = 96
+MATTING_MIN_INTERVAL = 0.1
+MATTING_MAX_INTERVAL = 1.0
+MATTING_COST_SMOOTHING = 0.1
+MATTING_MASK_FEATHER = 7
+MATTING_BLUR_DOWNSCALE = 4
+MATTING_BLUR_KERNEL = 9
+MATTING_GRABCUT_ITERATIONS = 2
+MATTING_SCALED_MASK_CACHE_SIZE = 4
+MATTING_MEDIAPIPE_MODEL = 1
+
+class ColorAdjustment:
+    def __init__(self):
+        self.settings = dict(COLOR_ADJUSTMENT_DEFAULTS)
+        self.lut = None
+        self.saturation_matrix = None
+        self.is_identity = True
+
+    def update(self, **settings):
+        changed = False
+        for name, value in settings.items():
+            low, high = COLOR_ADJUSTMENT_RANGES[name]
+            value = min(high, max(low, float(value)))
+            if self.settings[name] != value:
+                self.settings[name] = value
+                changed = True
+        if changed:
+            self.compile()
+
+    def compile(self):
+        self.is_identity = self.settings == COLOR_ADJUSTMENT_DEFAULTS
+        if self.is_identity:
+            self.lut = None
+            self.saturation_matrix = None
+            return
+        values = np.arange(256, dtype=np.float64) / 255.0
+        values = (values - 0.5) * self.settings["contrast"] + 0.5 + self.settings["brightness"] / 200.0
+        values = np.clip(values, 0.0, 1.0) ** (1.0 / self.settings["gamma"])
+        temperature_gain = self.settings["temperature"] / 100.0 * COLOR_TEMPERATURE_MAX_GAIN
+        channel_gains = np.array([1.0 - temperature_gain, 1.0, 1.0 + temperature_gain])
+        lut = np.clip(np.round(values[:, None] * channel_gains[None, :] * 255.0), 0, 255)
+        self.lut = lut.astype(np.uint8).reshape(256, 1, 3)
+        saturation = self.settings["saturation"]
+        if saturation == 1.0:
+            self.saturation_matrix = None
+        else:
+            luma_weights = np.array(COLOR_LUMA_WEIGHTS_BGR, dtype=np.float32)
+            self.saturation_matrix = (saturation * np.eye(3, dtype=np.float32) +
+                                      (1.0 - saturation) * np.ones((3, 1), dtype=np.float32) * luma_weights[None, :])
+
+    def apply(self, image):
+        if self.is_identity:
+            return image
+        if self.saturation_matrix is not None:
+            image = cv2.transform(image, self.saturation_matrix)
+        return cv2.LUT(image, self.lut)
+
+    def to_dict(self):
+        return dict(self.settings)
 
 class ImageState:
     def __init__(self, name, source_type, initial_width, initial_height, initial_x, initial_y,
-                 is_on_top=False, is_visible=True, camera_index=None, screen_region=None):
-        self.id = str(uuid.uuid4())
+                 is_on_top=False, is_visible=True, camera_index=None, screen_region=None, layer_id=None):
+        self.id = layer_id or str(uuid.uuid4())
         self.name = name
         self.source_type = source_type
         self.original_image = None
@@ -61,6 +276,100 @@ class ImageState:
         self.camera_index = camera_index
         self.screen_region = screen_region
         self.selected_app_window_info = None
+        self.replay_playback = None
+        self.frame_timestamp = None
+        self.frame_sequence = 0
+        self.is_awaiting_camera_frame = False
+        self.color_adjustment = ColorAdjustment()
+        self.matting_mode = MATTING_MODE_OFF
+        self.matting = None
+
+    def to_dict(self, z_index):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "source_type": self.source_type,
+            "x": int(self.x),
+            "y": int(self.y),
+            "width": int(self.display_width),
+            "height": int(self.display_height),
+            "visible": self.is_visible,
+            "z": z_index,
+            "aspect_ratio": self.aspect_ratio,
+            "color": self.color_adjustment.to_dict(),
+            "matting": self.matting_mode,
+        }
+
+    def to_scene_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "source_type": self.source_type,
+            "x": int(self.x),
+            "y": int(self.y),
+            "width": int(self.display_width),
+            "height": int(self.display_height),
+            "visible": self.is_visible,
+            "aspect_ratio": self.aspect_ratio,
+            "camera_index": self.camera_index,
+            "screen_region": self.screen_region,
+            "window_info": self.selected_app_window_info,
+            "color": self.color_adjustment.to_dict(),
+            "matting": self.matting_mode,
+        }
+
+def layer_state_from_scene_dict(layer_data):
+    layer_state = ImageState(layer_data["name"], layer_data["source_type"],
+                             layer_data["width"], layer_data["height"],
+                             layer_data["x"], layer_data["y"],
+                             is_visible=layer_data.get("visible", True),
+                             camera_index=layer_data.get("camera_index"),
+                             screen_region=layer_data.get("screen_region"),
+                             layer_id=layer_data.get("id"))
+    layer_state.aspect_ratio = layer_data.get("aspect_ratio", layer_state.aspect_ratio)
+    layer_state.selected_app_window_info = layer_data.get("window_info")
+    color_settings = layer_data.get("color") or {}
+    layer_state.color_adjustment.update(**{name: value for name, value in color_settings.items()
+                                           if name in COLOR_ADJUSTMENT_DEFAULTS})
+    if layer_state.source_type == SOURCE_TYPE_CAMERA and layer_data.get("matting") in MATTING_MODES:
+        layer_state.matting_mode = layer_data["matting"]
+    return layer_state
+
+def screen_region_key(region):
+    return (region["left"], region["top"], region["width"], region["height"])
+
+def load_scenes_file(path=None):
+    path = path or SCENES_FILE
+    if not os.path.exists(path):
+        return {"version": SCENES_FILE_VERSION, "scenes": {}, "last_layout": None}
+    try:
+        with open(path, "r", encoding="utf-8") as scenes_file:
+            data = json.load(scenes_file)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Ostrzeżenie: Nie można wczytać pliku scen '{path}': {e}")
+        return {"version": SCENES_FILE_VERSION, "scenes": {}, "last_layout": None}
+    data.setdefault("scenes", {})
+    data.setdefault("last_layout", None)
+    return data
+
+def save_scenes_file(data, path=None):
+    path = path or SCENES_FILE
+    temporary_path = path + ".tmp"
+    try:
+        with open(temporary_path, "w", encoding="utf-8") as scenes_file:
+            json.dump(data, scenes_file, ensure_ascii=False, indent=2)
+        os.replace(temporary_path, path)
+    except OSError as e:
+        print(f"Błąd: Nie można zapisać pliku scen '{path}': {e}")
+
+def open_video_capture(camera_index):
+    cap = cv2.VideoCapture(camera_index, cv2.CAP_DSHOW)
+    if not cap.isOpened():
+        print(f"Błąd: Nie można otworzyć kamery o indeksie {camera_index}. Upewnij się, że nie jest używana przez inną aplikację.")
+        return None
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, DEFAULT_CAM_WIDTH)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, DEFAULT_CAM_HEIGHT)
+    return cap
 
 def list_cameras():
     available_cameras = []
@@ -118,8 +427,9 @@ def enum_windows_callback(hwnd, lParam):
     return True
 
 def get_processes_with_windows_pywin32():
-    if not HAS_WIN32:
+    if not load_win32():
         return []
+    psutil = lazy_import("psutil")
     global ALL_WINDOWS_INFO
     ALL_WINDOWS_INFO = {}
     win32gui.EnumWindows(enum_windows_callback, None)
@@ -144,15 +454,849 @@ def get_processes_with_windows_pywin32():
     unique_processes_with_windows.sort(key=lambda x: x['name'].lower())
     return unique_processes_with_windows
 
+class LatencyHistogram:
+    def __init__(self, bucket_edges=LATENCY_BUCKETS_MS):
+        self.bucket_edges = bucket_edges
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.bucket_edges) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def record(self, value_ms):
+        self.counts[bisect.bisect_left(self.bucket_edges, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        self.maximum = max(self.maximum, value_ms)
+
+    def percentile(self, fraction):
+        if not self.count:
+            return None
+        threshold = fraction * self.count
+        cumulative = 0
+        for bucket_index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= threshold:
+                if bucket_index < len(self.bucket_edges):
+                    return min(self.bucket_edges[bucket_index], self.maximum)
+                return self.maximum
+        return self.maximum
+
+    def summary(self):
+        buckets = {f"<={edge}": count for edge, count in zip(self.bucket_edges, self.counts)}
+        buckets[f">{self.bucket_edges[-1]}"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count if self.count else None,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "max_ms": self.maximum if self.count else None,
+            "buckets": buckets,
+        }
+
+    def describe(self):
+        if not self.count:
+            return "brak pomiarów"
+        return (f"n={self.count}, średnio {self.total / self.count:.1f} ms, p50 ≤{self.percentile(0.5):.0f} ms, "
+                f"p95 ≤{self.percentile(0.95):.0f} ms, maks. {self.maximum:.1f} ms")
+
+class LatencySelfTest:
+    def __init__(self, bits=SELF_TEST_BITS, cell_size=SELF_TEST_CELL_SIZE, history_size=SELF_TEST_HISTORY_SIZE):
+        self.bits = bits
+        self.cell_size = cell_size
+        self.cell_count = bits + 2
+        self.counter = 0
+        self.sent_timestamps = {}
+        self.sent_order = deque()
+        self.history_size = history_size
+
+    @property
+    def aspect_ratio(self):
+        return float(self.cell_count)
+
+    def next_frame(self, timestamp):
+        self.counter = (self.counter + 1) % (1 << self.bits)
+        self.sent_timestamps[self.counter] = timestamp
+        self.sent_order.append(self.counter)
+        while len(self.sent_order) > self.history_size:
+            self.sent_timestamps.pop(self.sent_order.popleft(), None)
+        cells = [1] + [(self.counter >> bit) & 1 for bit in range(self.bits - 1, -1, -1)] + [0]
+        row = np.repeat(np.array(cells, dtype=np.uint8) * 255, self.cell_size)
+        return np.repeat(np.repeat(row[np.newaxis, :, np.newaxis], self.cell_size, axis=0), 3, axis=2)
+
+    def decode(self, frame, rect):
+        x, y, width, height = rect
+        cell_width = width / self.cell_count
+        if cell_width < 2 or height < 2:
+            return None
+        center_y = int(y + height / 2)
+        half_patch = max(1, int(min(cell_width, height) / 4))
+        if center_y - half_patch < 0 or center_y + half_patch >= frame.shape[0]:
+            return None
+        cells = []
+        for cell_index in range(self.cell_count):
+            center_x = int(x + (cell_index + 0.5) * cell_width)
+            if center_x - half_patch < 0 or center_x + half_patch >= frame.shape[1]:
+                return None
+            patch = frame[center_y - half_patch:center_y + half_patch + 1, center_x - half_patch:center_x + half_patch + 1]
+            cells.append(1 if patch.mean() > 127 else 0)
+        if cells[0] != 1 or cells[-1] != 0:
+            return None
+        value = 0
+        for bit in cells[1:-1]:
+            value = (value << 1) | bit
+        return value
+
+    def sent_timestamp(self, frame, rect):
+        value = self.decode(frame, rect)
+        return self.sent_timestamps.get(value) if value is not None else None
+
+def qimage_to_array(q_img):
+    channels = q_img.depth() // 8
+    rows = np.frombuffer(q_img.constBits(), dtype=np.uint8, count=q_img.sizeInBytes()).reshape(q_img.height(), q_img.bytesPerLine())
+    return rows[:, :q_img.width() * channels].reshape(q_img.height(), q_img.width(), channels)
+
+def map_canvas_rect_to_output(rect, canvas_width, canvas_height, output_width, output_height):
+    scale = min(output_width / canvas_width, output_height / canvas_height)
+    offset_x = (output_width - max(1, int(round(canvas_width * scale)))) // 2
+    offset_y = (output_height - max(1, int(round(canvas_height * scale)))) // 2
+    x, y, width, height = rect
+    return (x * scale + offset_x, y * scale + offset_y, width * scale, height * scale)
+
+class OutputProfile:
+    def __init__(self, name, width=None, height=None, fps=MASTER_FPS):
+        self.name = name
+        self.width = width
+        self.height = height
+        self.fps = max(1, min(MASTER_FPS, fps))
+        self.frame_interval = MASTER_FPS // self.fps if MASTER_FPS % self.fps == 0 else None
+        self.next_due_time = 0.0
+        self.frame_skip_interval = 1
+        self.sinks = []
+        self.delivered_frames = 0
+        self.last_layer_frames = []
+        self.oldest_layer_age_histogram = LatencyHistogram()
+        self.newest_layer_age_histogram = LatencyHistogram()
+        self.self_test_histogram = LatencyHistogram()
+        self.latency_lock = threading.Lock()
+
+    def add_sink(self, callback, is_active=None, is_async=False):
+        self.sinks.append((callback, is_active, is_async))
+
+    def has_active_sinks(self):
+        return any(is_active is None or is_active() for _, is_active, _ in self.sinks)
+
+    def target_size(self, canvas_width, canvas_height):
+        return (self.width or canvas_width, self.height or canvas_height)
+
+    def fit_scale(self, canvas_width, canvas_height):
+        target_width, target_height = self.target_size(canvas_width, canvas_height)
+        return min(target_width / canvas_width, target_height / canvas_height)
+
+    def is_due(self, frame_tick, now):
+        if not self.has_active_sinks():
+            return False
+        if self.frame_skip_interval > 1 and frame_tick % self.frame_skip_interval != 0:
+            return False
+        if self.frame_interval is not None:
+            return frame_tick % self.frame_interval == 0
+        if now + 0.5 / MASTER_FPS < self.next_due_time:
+            return False
+        self.next_due_time = max(self.next_due_time + 1.0 / self.fps, now)
+        return True
+
+    def deliver(self, frame, layer_frames=(), self_test_probe=None):
+        self.delivered_frames += 1
+        self.last_layer_frames = layer_frames
+        capture_timestamps = [timestamp for _, _, timestamp in layer_frames if timestamp is not None]
+        on_presented = lambda presented_at, read_presented_frame=None: self.record_presentation(
+            presented_at, capture_timestamps, self_test_probe, read_presented_frame)
+        has_async_sinks = False
+        for callback, is_active, is_async in self.sinks:
+            if is_active is None or is_active():
+                if is_async:
+                    callback(frame, on_presented)
+                    has_async_sinks = True
+                else:
+                    callback(frame)
+        if not has_async_sinks:
+            on_presented(time.perf_counter())
+
+    def record_presentation(self, presented_at, capture_timestamps, self_test_probe, read_presented_frame):
+        self_test_sent_at = None
+        if self_test_probe is not None and read_presented_frame is not None:
+            self_test_sent_at = self_test_probe(read_presented_frame())
+        with self.latency_lock:
+            if capture_timestamps:
+                self.oldest_layer_age_histogram.record((presented_at - min(capture_timestamps)) * 1000.0)
+                self.newest_layer_age_histogram.record((presented_at - max(capture_timestamps)) * 1000.0)
+            if self_test_sent_at is not None:
+                self.self_test_histogram.record((presented_at - self_test_sent_at) * 1000.0)
+
+    def latency_report(self):
+        with self.latency_lock:
+            return {
+                "delivered_frames": self.delivered_frames,
+                "presented_at": OUTPUT_PRESENTATION_POINTS.get(self.name),
+                "oldest_layer_age": self.oldest_layer_age_histogram.summary(),
+                "newest_layer_age": self.newest_layer_age_histogram.summary(),
+                "self_test": self.self_test_histogram.summary(),
+            }
+
+    def reset_latency(self):
+        with self.latency_lock:
+            self.oldest_layer_age_histogram.reset()
+            self.newest_layer_age_histogram.reset()
+            self.self_test_histogram.reset()
+
+class QualityGovernor:
+    def __init__(self, target_frame_time, levels=QUALITY_LEVELS):
+        self.target_frame_time = target_frame_time
+        self.levels = levels
+        self.level_index = 0
+        self.average_frame_time = None
+        self.over_budget_frames = 0
+        self.under_budget_frames = 0
+        self.events = deque(maxlen=QUALITY_EVENT_LOG_SIZE)
+
+    @property
+    def level(self):
+        return self.levels[self.level_index]
+
+    def record_frame_time(self, frame_time):
+        if self.average_frame_time is None:
+            self.average_frame_time = frame_time
+        else:
+            self.average_frame_time += QUALITY_SMOOTHING * (frame_time - self.average_frame_time)
+        if self.average_frame_time > self.target_frame_time * QUALITY_DOWNGRADE_RATIO:
+            self.over_budget_frames += 1
+            self.under_budget_frames = 0
+        elif self.average_frame_time < self.target_frame_time * QUALITY_UPGRADE_RATIO:
+            self.under_budget_frames += 1
+            self.over_budget_frames = 0
+        else:
+            self.over_budget_frames = 0
+            self.under_budget_frames = 0
+        if self.over_budget_frames >= QUALITY_DOWNGRADE_FRAMES and self.level_index < len(self.levels) - 1:
+            self._change_level(self.level_index + 1)
+            return True
+        if self.under_budget_frames >= QUALITY_UPGRADE_FRAMES and self.level_index > 0:
+            self._change_level(self.level_index - 1)
+            return True
+        return False
+
+    def _change_level(self, new_level_index):
+        previous_level = self.level
+        self.level_index = new_level_index
+        self.over_budget_frames = 0
+        self.under_budget_frames = 0
+        event = {
+            "time": time.time(),
+            "from": previous_level["name"],
+            "to": self.level["name"],
+            "level": self.level_index,
+            "average_frame_time_ms": self.average_frame_time * 1000.0,
+            "target_frame_time_ms": self.target_frame_time * 1000.0,
+        }
+        self.events.append(event)
+        print(f"Regulator jakości: '{event['from']}' -> '{event['to']}' "
+              f"(średni czas klatki {event['average_frame_time_ms']:.1f} ms, budżet {event['target_frame_time_ms']:.1f} ms)")
+
+class FramePyramid:
+    def __init__(self, base_frame):
+        self.levels = [base_frame]
+        self.derived_frames = {}
+
+    def _level_for(self, width, height):
+        level_index = 0
+        while True:
+            level = self.levels[level_index]
+            half_width, half_height = level.shape[1] // 2, level.shape[0] // 2
+            if half_width < max(1, width) or half_height < max(1, height):
+                return level
+            if level_index + 1 == len(self.levels):
+                self.levels.append(cv2.resize(level, (half_width, half_height), interpolation=cv2.INTER_AREA))
+            level_index += 1
+
+    def get(self, width, height):
+        key = (width, height)
+        if key in self.derived_frames:
+            return self.derived_frames[key]
+        base_height, base_width = self.levels[0].shape[:2]
+        scale = min(width / base_width, height / base_height)
+        fit_width = max(1, min(width, int(round(base_width * scale))))
+        fit_height = max(1, min(height, int(round(base_height * scale))))
+        level = self._level_for(fit_width, fit_height)
+        if level.shape[1] != fit_width or level.shape[0] != fit_height:
+            interpolation = cv2.INTER_AREA if level.shape[1] > fit_width else cv2.INTER_LINEAR
+            frame = cv2.resize(level, (fit_width, fit_height), interpolation=interpolation)
+        else:
+            frame = level
+        if fit_width != width or fit_height != height:
+            padded_frame = np.zeros((height, width) + frame.shape[2:], dtype=frame.dtype)
+            offset_x = (width - fit_width) // 2
+            offset_y = (height - fit_height) // 2
+            padded_frame[offset_y:offset_y + fit_height, offset_x:offset_x + fit_width] = frame
+            frame = padded_frame
+        self.derived_frames[key] = frame
+        return frame
+
+class WarmCameraDrainer:
+    def __init__(self, interval=WARM_CAMERA_DRAIN_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.idle_captures = {}
+        self.capture_locks = {}
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="warm-camera-drain", daemon=True)
+        self.thread.start()
+
+    def capture_lock(self, camera_index):
+        with self.lock:
+            return self.capture_locks.setdefault(camera_index, threading.Lock())
+
+    def set_idle_captures(self, idle_captures):
+        with self.lock:
+            self.idle_captures = dict(idle_captures)
+
+    def read(self, camera_index, cap):
+        with self.capture_lock(camera_index):
+            return cap.read()
+
+    def release(self, camera_index, cap):
+        with self.capture_lock(camera_index):
+            cap.release()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            with self.lock:
+                idle_captures = list(self.idle_captures.items())
+            for camera_index, cap in idle_captures:
+                with self.capture_lock(camera_index):
+                    if cap.isOpened():
+                        cap.grab()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join(1.0)
+
+class FrameEncoderPool:
+    def __init__(self, workers=STREAM_ENCODER_WORKERS, jpeg_quality=STREAM_JPEG_QUALITY):
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="jpeg-encoder")
+        self.max_in_flight = max(1, workers)
+        self.jpeg_quality = jpeg_quality
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.skipped_frames = 0
+
+    def submit(self, frame, callback):
+        with self.lock:
+            if self.in_flight >= self.max_in_flight:
+                self.skipped_frames += 1
+                return False
+            self.in_flight += 1
+        future = self.executor.submit(self._encode_jpeg, frame)
+        future.add_done_callback(lambda done: self._on_encoded(done, callback))
+        return True
+
+    def _encode_jpeg(self, frame):
+        ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        return buffer.tobytes() if ok else None
+
+    def _on_encoded(self, future, callback):
+        with self.lock:
+            self.in_flight -= 1
+        if future.cancelled():
+            return
+        try:
+            data = future.result()
+        except Exception as e:
+            print(f"Błąd kodowania klatki JPEG: {e}")
+            return
+        if data is not None:
+            callback(data)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+class ReplayBuffer:
+    def __init__(self, seconds=REPLAY_SECONDS, max_memory_mb=REPLAY_MAX_MEMORY_MB, fps=MASTER_FPS,
+                 encoder_workers=REPLAY_ENCODER_WORKERS, jpeg_quality=REPLAY_JPEG_QUALITY):
+        self.seconds = seconds
+        self.max_bytes = int(max_memory_mb * 1024 * 1024)
+        self.capacity = max(1, int(seconds * fps) + 1)
+        self.slots = [None] * self.capacity
+        self.timestamps = [0.0] * self.capacity
+        self.head = 0
+        self.count = 0
+        self.total_bytes = 0
+        self.last_timestamp = 0.0
+        self.lock = threading.Lock()
+        self.encoder_pool = FrameEncoderPool(encoder_workers, jpeg_quality)
+
+    def push_frame(self, frame, on_stored=None):
+        timestamp = time.perf_counter()
+        self.encoder_pool.submit(frame, lambda data: self._append(timestamp, data, on_stored))
+
+    def _append(self, timestamp, data, on_stored=None):
+        with self.lock:
+            if timestamp <= self.last_timestamp or len(data) > self.max_bytes:
+                return
+            while self.count and (self.count == self.capacity or
+                                  self.total_bytes + len(data) > self.max_bytes or
+                                  timestamp - self.timestamps[self.head] > self.seconds):
+                self._evict_oldest()
+            slot = (self.head + self.count) % self.capacity
+            self.slots[slot] = data
+            self.timestamps[slot] = timestamp
+            self.count += 1
+            self.total_bytes += len(data)
+            self.last_timestamp = timestamp
+        if on_stored is not None:
+            on_stored(time.perf_counter(), lambda: cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR))
+
+    def _evict_oldest(self):
+        self.total_bytes -= len(self.slots[self.head])
+        self.slots[self.head] = None
+        self.head = (self.head + 1) % self.capacity
+        self.count -= 1
+
+    def _timestamp_at(self, index):
+        return self.timestamps[(self.head + index) % self.capacity]
+
+    def _index_at_or_before(self, timestamp):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._timestamp_at(middle) <= timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return max(0, low - 1)
+
+    def time_range(self):
+        with self.lock:
+            if not self.count:
+                return None
+            return (self._timestamp_at(0), self._timestamp_at(self.count - 1))
+
+    def encoded_frame_at(self, timestamp):
+        with self.lock:
+            if not self.count:
+                return None
+            slot = (self.head + self._index_at_or_before(timestamp)) % self.capacity
+            return (self.timestamps[slot], self.slots[slot])
+
+    def encoded_frames_between(self, start_time, end_time):
+        with self.lock:
+            if not self.count:
+                return []
+            frames = []
+            for index in range(self._index_at_or_before(start_time), self.count):
+                slot = (self.head + index) % self.capacity
+                if self.timestamps[slot] > end_time:
+                    break
+                if self.timestamps[slot] >= start_time:
+                    frames.append((self.timestamps[slot], self.slots[slot]))
+            return frames
+
+    def export(self, path, start_time=None, end_time=None):
+        time_range = self.time_range()
+        if time_range is None:
+            return False
+        frames = self.encoded_frames_between(time_range[0] if start_time is None else start_time,
+                                             time_range[1] if end_time is None else end_time)
+        if len(frames) < 2:
+            return False
+        threading.Thread(target=self._write_video, args=(path, frames), name="replay-export", daemon=True).start()
+        return True
+
+    def _write_video(self, path, frames):
+        fps = (len(frames) - 1) / max(1e-6, frames[-1][0] - frames[0][0])
+        writer = None
+        try:
+            for _, data in frames:
+                frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if frame is None:
+                    continue
+                if writer is None:
+                    height, width = frame.shape[:2]
+                    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*REPLAY_EXPORT_FOURCC), fps, (width, height))
+                    if not writer.isOpened():
+                        print(f"Błąd: Nie można utworzyć pliku powtórki '{path}'.")
+                        return
+                writer.write(frame)
+            print(f"Powtórka zapisana do pliku '{path}' ({len(frames)} klatek, {fps:.1f} FPS).")
+        finally:
+            if writer is not None:
+                writer.release()
+
+    def shutdown(self):
+        self.encoder_pool.shutdown()
+
+class ReplayPlayback:
+    def __init__(self, replay_buffer, start_time, end_time):
+        self.replay_buffer = replay_buffer
+        self.start_time = start_time
+        self.duration = max(1e-3, end_time - start_time)
+        self.started_at = time.perf_counter()
+        self.frame_timestamp = None
+        self.frame = None
+
+    def current_frame(self, now):
+        target_time = self.start_time + (now - self.started_at) % self.duration
+        encoded_frame = self.replay_buffer.encoded_frame_at(target_time)
+        if encoded_frame is None:
+            return None
+        timestamp, data = encoded_frame
+        if timestamp != self.frame_timestamp:
+            self.frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            self.frame_timestamp = timestamp
+        return self.frame
+
+class CameraMatting:
+    def __init__(self, executor):
+        self.executor = executor
+        self.future = None
+        self.mask = None
+        self.mask_version = 0
+        self.scaled_masks_version = None
+        self.scaled_masks = {}
+        self.input_width = MATTING_INPUT_WIDTH
+        self.update_interval = MATTING_MIN_INTERVAL
+        self.next_update_time = 0.0
+        self.worker_cost_ms = 0.0
+        self.composite_cost_ms = 0.0
+        self.segmenter = None
+        self.face_cascade = None
+        self.last_error = None
+
+    def update(self, frame, now):
+        if self.future is not None:
+            if not self.future.done():
+                return
+            try:
+                mask, worker_cost_ms = self.future.result()
+            except Exception as e:
+                if str(e) != self.last_error:
+                    print(f"Błąd wycinania tła kamery: {e}")
+                    self.last_error = str(e)
+                mask, worker_cost_ms = None, self.worker_cost_ms
+            self.future = None
+            if mask is not None:
+                self.mask = mask
+                self.mask_version += 1
+            self.worker_cost_ms = worker_cost_ms
+            self.adapt_to_budget()
+        if frame is not None and now >= self.next_update_time:
+            self.next_update_time = now + self.update_interval
+            self.future = self.executor.submit(self.compute_mask, frame, self.input_width)
+
+    def adapt_to_budget(self):
+        available_ms = max(MATTING_FRAME_BUDGET_MS * 0.25, MATTING_FRAME_BUDGET_MS - self.composite_cost_ms)
+        required_interval = self.worker_cost_ms / (available_ms * MASTER_FPS)
+        if required_interval > MATTING_MAX_INTERVAL:
+            self.input_width = max(MATTING_MIN_INPUT_WIDTH, int(self.input_width * 0.75))
+        elif required_interval < MATTING_MIN_INTERVAL * 0.5:
+            self.input_width = min(MATTING_INPUT_WIDTH, int(self.input_width * 1.25))
+        self.update_interval = min(MATTING_MAX_INTERVAL, max(MATTING_MIN_INTERVAL, required_interval))
+
+    def compute_mask(self, frame, input_width):
+        start_time = time.perf_counter()
+        input_height = max(1, int(round(frame.shape[0] * input_width / frame.shape[1])))
+        small_frame = cv2.resize(frame, (input_width, input_height), interpolation=cv2.INTER_AREA)
+        if load_mediapipe():
+            mask = self.segment_mediapipe(small_frame)
+        else:
+            mask = self.segment_grabcut(small_frame)
+        if mask is not None:
+            mask = cv2.GaussianBlur(mask, (MATTING_MASK_FEATHER, MATTING_MASK_FEATHER), 0)
+        return mask, (time.perf_counter() - start_time) * 1000.0
+
+    def segment_mediapipe(self, small_frame):
+        if self.segmenter is None:
+            self.segmenter = mediapipe.solutions.selfie_segmentation.SelfieSegmentation(
+                model_selection=MATTING_MEDIAPIPE_MODEL)
+        result = self.segmenter.process(cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB))
+        if result.segmentation_mask is None:
+            return None
+        return result.segmentation_mask.astype(np.float32)
+
+    def segment_grabcut(self, small_frame):
+        if self.face_cascade is None:
+            self.face_cascade = False
+            if hasattr(cv2, "CascadeClassifier") and hasattr(cv2, "data"):
+                face_cascade = cv2.CascadeClassifier(
+                    os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml"))
+                if not face_cascade.empty():
+                    self.face_cascade = face_cascade
+        height, width = small_frame.shape[:2]
+        previous_mask = self.mask
+        if previous_mask is not None:
+            previous_mask = cv2.resize(previous_mask, (width, height), interpolation=cv2.INTER_LINEAR)
+            grabcut_mask = np.where(previous_mask > 0.5, cv2.GC_PR_FGD, cv2.GC_PR_BGD).astype(np.uint8)
+        else:
+            grabcut_mask = np.full((height, width), cv2.GC_PR_BGD, dtype=np.uint8)
+            grabcut_mask[height // 5:, width // 4:width * 3 // 4] = cv2.GC_PR_FGD
+        faces = ()
+        if self.face_cascade:
+            faces = self.face_cascade.detectMultiScale(cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY), 1.1, 4,
+                                                       minSize=(12, 12))
+        if len(faces):
+            x, y, w, h = max(faces, key=lambda face: face[2] * face[3])
+            grabcut_mask[y + h:, max(0, x - w // 2):x + w + w // 2] = cv2.GC_PR_FGD
+            grabcut_mask[y + h // 4:y + h * 3 // 4, x + w // 4:x + w * 3 // 4] = cv2.GC_FGD
+        border = max(1, width // 32)
+        grabcut_mask[:border, :] = cv2.GC_BGD
+        grabcut_mask[:, :border] = cv2.GC_BGD
+        grabcut_mask[:, -border:] = cv2.GC_BGD
+        if not np.any((grabcut_mask == cv2.GC_FGD) | (grabcut_mask == cv2.GC_PR_FGD)):
+            return np.zeros((height, width), dtype=np.float32)
+        background_model = np.zeros((1, 65), dtype=np.float64)
+        foreground_model = np.zeros((1, 65), dtype=np.float64)
+        cv2.grabCut(small_frame, grabcut_mask, None, background_model, foreground_model,
+                    MATTING_GRABCUT_ITERATIONS, cv2.GC_INIT_WITH_MASK)
+        return np.where((grabcut_mask == cv2.GC_FGD) | (grabcut_mask == cv2.GC_PR_FGD), 1.0, 0.0).astype(np.float32)
+
+    def composite(self, image, background, mode, scaled_size, source_offset):
+        if self.mask is None:
+            return image
+        start_time = time.perf_counter()
+        if self.scaled_masks_version != self.mask_version:
+            self.scaled_masks = {}
+            self.scaled_masks_version = self.mask_version
+        scaled_masks = self.scaled_masks.get(scaled_size)
+        if scaled_masks is None:
+            if len(self.scaled_masks) >= MATTING_SCALED_MASK_CACHE_SIZE:
+                del self.scaled_masks[next(iter(self.scaled_masks))]
+            scaled_mask = cv2.resize(self.mask, scaled_size, interpolation=cv2.INTER_LINEAR)
+            scaled_masks = (scaled_mask, 1.0 - scaled_mask)
+            self.scaled_masks[scaled_size] = scaled_masks
+        scaled_mask, scaled_inverse_mask = scaled_masks
+        source_x, source_y = source_offset
+        height, width = image.shape[:2]
+        alpha = np.ascontiguousarray(scaled_mask[source_y:source_y + height, source_x:source_x + width])
+        inverse_alpha = np.ascontiguousarray(scaled_inverse_mask[source_y:source_y + height, source_x:source_x + width])
+        if mode == MATTING_MODE_BLUR:
+            small_image = cv2.resize(image, (max(1, width // MATTING_BLUR_DOWNSCALE), max(1, height // MATTING_BLUR_DOWNSCALE)),
+                                     interpolation=cv2.INTER_AREA)
+            small_image = cv2.GaussianBlur(small_image, (MATTING_BLUR_KERNEL, MATTING_BLUR_KERNEL), 0)
+            background = cv2.resize(small_image, (width, height), interpolation=cv2.INTER_LINEAR)
+        result = cv2.blendLinear(image, background, alpha, inverse_alpha)
+        composite_cost_ms = (time.perf_counter() - start_time) * 1000.0
+        self.composite_cost_ms += (composite_cost_ms - self.composite_cost_ms) * MATTING_COST_SMOOTHING
+        return result
+
+class LayerControlError(Exception):
+    pass
+
+class RoiSelectionDialog(QDialog):
+    roi_selected = Signal(dict, dict)
+    roi_cancelled = Signal()
+
+    def __init__(self, app_window_info, parent=None):
+        super().__init__(parent)
+        self.app_window_info = app_window_info
+        self.capture_region = {
+            "top": app_window_info['top'],
+            "left": app_window_info['left'],
+            "width": app_window_info['width'],
+            "height": app_window_info['height'],
+        }
+        self.current_frame = None
+        self.selection_start = None
+        self.selection_end = None
+        self.display_scale = 1.0
+        self.display_offset_x = 0
+        self.display_offset_y = 0
+        self.is_finished = False
+        self.setWindowTitle(f"Zaznacz obszar do przechwycenia w: '{app_window_info['title']}'")
+        self.setModal(False)
+        layout = QVBoxLayout(self)
+        self.hint_label = QLabel("Zaznacz myszką obszar i zatwierdź ENTER lub 'OK'. ESC anuluje.")
+        layout.addWidget(self.hint_label)
+        self.frame_label = QLabel()
+        self.frame_label.setAlignment(Qt.AlignCenter)
+        self.frame_label.setStyleSheet("background-color: black;")
+        self.frame_label.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.frame_label.setMinimumSize(320, 240)
+        self.frame_label.setCursor(Qt.CrossCursor)
+        self.frame_label.mousePressEvent = self.frame_mouse_press_event
+        self.frame_label.mouseMoveEvent = self.frame_mouse_move_event
+        self.frame_label.mouseReleaseEvent = self.frame_mouse_release_event
+        layout.addWidget(self.frame_label)
+        self.button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        self.button_box.accepted.connect(self.accept)
+        self.button_box.rejected.connect(self.reject)
+        self.button_box.button(QDialogButtonBox.Ok).setEnabled(False)
+        layout.addWidget(self.button_box)
+        fit_scale = min(1.0, ROI_PREVIEW_MAX_WIDTH / max(1, app_window_info['width']),
+                        ROI_PREVIEW_MAX_HEIGHT / max(1, app_window_info['height']))
+        self.resize(max(320, int(app_window_info['width'] * fit_scale)),
+                    max(240, int(app_window_info['height'] * fit_scale)) + 80)
+
+    def update_frame(self, frame):
+        self.current_frame = frame
+        self.render_frame()
+
+    def render_frame(self):
+        if self.current_frame is None:
+            return
+        frame = np.ascontiguousarray(self.current_frame)
+        height, width = frame.shape[:2]
+        label_width, label_height = self.frame_label.width(), self.frame_label.height()
+        if label_width <= 0 or label_height <= 0 or width <= 0 or height <= 0:
+            return
+        self.display_scale = min(label_width / width, label_height / height)
+        display_width = max(1, int(width * self.display_scale))
+        display_height = max(1, int(height * self.display_scale))
+        self.display_offset_x = (label_width - display_width) // 2
+        self.display_offset_y = (label_height - display_height) // 2
+        display_frame = cv2.resize(frame, (display_width, display_height), interpolation=cv2.INTER_LINEAR)
+        selection_rect = self.selected_rect()
+        if selection_rect:
+            x, y, w, h = selection_rect
+            top_left = (int(x * self.display_scale), int(y * self.display_scale))
+            bottom_right = (int((x + w) * self.display_scale), int((y + h) * self.display_scale))
+            cv2.rectangle(display_frame, top_left, bottom_right, (0, 255, 0), 2)
+        q_img = QImage(display_frame.data, display_width, display_height, 3 * display_width, QImage.Format_RGB888).rgbSwapped()
+        self.frame_label.setPixmap(QPixmap.fromImage(q_img))
+
+    def label_to_frame_point(self, event):
+        if self.current_frame is None or self.display_scale <= 0:
+            return None
+        height, width = self.current_frame.shape[:2]
+        x = (event.position().x() - self.display_offset_x) / self.display_scale
+        y = (event.position().y() - self.display_offset_y) / self.display_scale
+        return (int(round(max(0, min(width, x)))), int(round(max(0, min(height, y)))))
+
+    def selected_rect(self):
+        if self.selection_start is None or self.selection_end is None:
+            return None
+        x1, y1 = self.selection_start
+        x2, y2 = self.selection_end
+        x, y, w, h = min(x1, x2), min(y1, y2), abs(x2 - x1), abs(y2 - y1)
+        if w <= 0 or h <= 0:
+            return None
+        return (x, y, w, h)
+
+    def frame_mouse_press_event(self, event: QMouseEvent):
+        point = self.label_to_frame_point(event)
+        if point is None:
+            return
+        self.selection_start = point
+        self.selection_end = point
+        self.button_box.button(QDialogButtonBox.Ok).setEnabled(False)
+        self.render_frame()
+
+    def frame_mouse_move_event(self, event: QMouseEvent):
+        if self.selection_start is None or not (event.buttons() & Qt.LeftButton):
+            return
+        point = self.label_to_frame_point(event)
+        if point is not None:
+            self.selection_end = point
+            self.render_frame()
+
+    def frame_mouse_release_event(self, event: QMouseEvent):
+        if self.selection_start is None:
+            return
+        point = self.label_to_frame_point(event)
+        if point is not None:
+            self.selection_end = point
+        self.button_box.button(QDialogButtonBox.Ok).setEnabled(self.selected_rect() is not None)
+        self.render_frame()
+
+    def accept(self):
+        selection_rect = self.selected_rect()
+        if selection_rect is None:
+            return
+        x_local, y_local, w, h = selection_rect
+        selected_screen_region = {
+            "top": self.capture_region["top"] + y_local,
+            "left": self.capture_region["left"] + x_local,
+            "width": w,
+            "height": h,
+        }
+        self.is_finished = True
+        super().accept()
+        self.roi_selected.emit(selected_screen_region, self.app_window_info)
+
+    def reject(self):
+        if self.is_finished:
+            return
+        self.is_finished = True
+        super().reject()
+        self.roi_cancelled.emit()
+
+class ColorAdjustmentDialog(QDialog):
+    def __init__(self, layer_state, parent=None):
+        super().__init__(parent)
+        self.layer_state = layer_state
+        self.initial_settings = layer_state.color_adjustment.to_dict()
+        self.setWindowTitle(f"Kolor warstwy: '{layer_state.name}'")
+        layout = QGridLayout(self)
+        self.sliders = {}
+        self.value_labels = {}
+        for row, name in enumerate(COLOR_ADJUSTMENT_DEFAULTS):
+            low, high = COLOR_ADJUSTMENT_RANGES[name]
+            scale = COLOR_ADJUSTMENT_SLIDER_SCALE[name]
+            slider = QSlider(Qt.Horizontal)
+            slider.setRange(int(round(low * scale)), int(round(high * scale)))
+            slider.setValue(int(round(self.initial_settings[name] * scale)))
+            slider.valueChanged.connect(self.on_slider_changed)
+            value_label = QLabel()
+            value_label.setMinimumWidth(48)
+            layout.addWidget(QLabel(COLOR_ADJUSTMENT_LABELS[name]), row, 0)
+            layout.addWidget(slider, row, 1)
+            layout.addWidget(value_label, row, 2)
+            self.sliders[name] = slider
+            self.value_labels[name] = value_label
+        self.button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel | QDialogButtonBox.Reset)
+        self.button_box.accepted.connect(self.accept)
+        self.button_box.rejected.connect(self.reject)
+        self.button_box.button(QDialogButtonBox.Reset).clicked.connect(self.reset_settings)
+        layout.addWidget(self.button_box, len(COLOR_ADJUSTMENT_DEFAULTS), 0, 1, 3)
+        self.update_value_labels()
+        self.resize(420, self.sizeHint().height())
+
+    def current_settings(self):
+        return {name: slider.value() / COLOR_ADJUSTMENT_SLIDER_SCALE[name] for name, slider in self.sliders.items()}
+
+    def update_value_labels(self):
+        for name, value in self.current_settings().items():
+            self.value_labels[name].setText(f"{value:g}")
+
+    def on_slider_changed(self):
+        self.update_value_labels()
+        self.layer_state.color_adjustment.update(**self.current_settings())
+
+    def reset_settings(self):
+        for name, slider in self.sliders.items():
+            slider.setValue(int(round(COLOR_ADJUSTMENT_DEFAULTS[name] * COLOR_ADJUSTMENT_SLIDER_SCALE[name])))
+
+    def reject(self):
+        self.layer_state.color_adjustment.update(**self.initial_settings)
+        super().reject()
+
 class CameraScreenOverlayApp(QMainWindow):
     update_image_signal = Signal(np.ndarray)
+    scene_hotkey_signal = Signal(str)
+    discovery_finished_signal = Signal(list, list, object)
 
     def __init__(self):
+        ui_start_time = time.perf_counter()
         super().__init__()
         self.setWindowTitle(PREVIEW_WINDOW_NAME)
         self.setGeometry(100, 100, INITIAL_PREVIEW_WINDOW_WIDTH, INITIAL_PREVIEW_WINDOW_HEIGHT)
-        self.cap = None
-        self.screen_capture_instance = mss.mss()
+        self.camera_captures = {}
+        self.warm_camera_drainer = WarmCameraDrainer()
+        self.screen_capture_sources = {}
+        self.isolated_capture_enabled = ISOLATED_CAPTURE_ENABLED
+        self.screen_capture_instance = None
+        self.available_cameras = []
+        self.available_processes_with_windows = []
         self.image_states = []
         self.active_camera_layer_id = None
         self.active_draggable_image_state = None
@@ -160,19 +1304,38 @@ class CameraScreenOverlayApp(QMainWindow):
         self.resize_handle_active = None
         self.last_mouse_x = -1
         self.last_mouse_y = -1
-        self.is_roi_selection_active = False
+        self.roi_selection_dialog = None
+        self.roi_preview_source = None
         self.selected_app_window_info_for_new_layer = None
+        self.network_stream_output = None
+        self.layer_control_server = None
+        self.is_first_frame_pending = True
+        self.replay_buffer = ReplayBuffer()
+        self.is_replay_recording = REPLAY_RECORDING_AT_START
+        self.matting_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="matting")
+        self.latency_self_test = LatencySelfTest()
+        self.preview_presented_callback = None
+        self.frame_tick = 0
+        self.quality_governor = QualityGovernor(1.0 / MASTER_FPS)
+        self.output_profiles = [OutputProfile(**profile) for profile in OUTPUT_PROFILES]
+        self.scenes_data = load_scenes_file()
+        self.active_scene_name = None
+        self.registered_scene_hotkeys = []
         self.init_ui()
-        self.init_camera_layer()
+        self.init_output_sinks()
+        self.update_scenes_combobox()
+        if not self.restore_last_layout(open_cameras=False):
+            self.init_camera_layer()
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update_frame)
-        self.timer.start(30)
+        self.timer.start(int(1000 / MASTER_FPS))
+        STARTUP_TIMINGS["ui"] = time.perf_counter() - ui_start_time
         print("\n--- INSTRUKCJE UŻYTKOWANIA ---")
         print("1. Wybierz kamerę z listy 'Wybierz kamerę'.")
         print("2. Aby dodać warstwę z aplikacji:")
         print("   - Wybierz 'Wybierz aplikację'.")
         print("   - Jeśli aplikacja ma wiele okien, wybierz konkretne okno z 'Wybierz okno'.")
-        print("   - Kliknij 'Dodaj warstwę z ROI', a następnie w nowym oknie zaznacz obszar myszką i zatwierdź ENTER.")
+        print("   - Kliknij 'Dodaj warstwę z ROI', a następnie w oknie zaznaczania (podgląd na żywo) zaznacz obszar myszką i zatwierdź ENTER.")
         print("   - Nowa warstwa zostanie dodana do listy 'Zarządzaj warstwami'.")
         print("3. Użyj listy 'Zarządzaj warstwami' i przycisków obok, aby kontrolować warstwy:")
         print("   - 'Włącz/Wyłącz': Przełącza widoczność wybranej warstwy.")
@@ -186,6 +1349,30 @@ class CameraScreenOverlayApp(QMainWindow):
         print("   - Użyj kółka myszy nad warstwą, aby ją skalować (zoom).")
         print("   - Przeciągnij krawędzie lub rogi warstwy, aby zmienić jej rozmiar (zachowując proporcje).")
         print("   - Zaznacz warstwę w comboboxie 'Zarządzaj warstwami', a następnie użyj klawiszy strzałek (↑↓←→), aby precyzyjnie przesuwać wybraną warstwę.")
+        print("5. Kliknij 'Włącz strumień LAN', aby udostępnić podgląd w sieci lokalnej:")
+        print(f"   - MJPEG przez HTTP: http://<adres_komputera>:{STREAM_HTTP_PORT}/stream.mjpg")
+        print(f"   - Surowe klatki BGR przez TCP na porcie {STREAM_TCP_PORT} (nagłówek: długość, numer klatki, szerokość, wysokość, kanały).")
+        print(f"6. API sterowania warstwami (tylko localhost, port {CONTROL_API_PORT}):")
+        print("   - GET /layers: lista warstw (z = pozycja w kolejności rysowania, 0 = spód).")
+        print("   - POST /layers/batch z treścią {\"updates\": [{\"id\": ..., \"x\": ..., \"visible\": ..., \"z\": \"front\"}]}:")
+        print("     wszystkie zmiany są stosowane razem między klatkami albo żadna, jeśli któraś jest nieprawidłowa.")
+        print(f"   - Wymagany nagłówek Content-Type: application/json i Host: localhost:{CONTROL_API_PORT} lub 127.0.0.1:{CONTROL_API_PORT}.")
+        print("7. Sceny:")
+        print("   - 'Zapisz scenę' zapisuje bieżący układ warstw pod nazwą (w pliku scenes.json).")
+        print("   - 'Wczytaj scenę' lub skrót Ctrl+Alt+<numer sceny> przełącza scenę bez ponownego otwierania kamer.")
+        print("   - Układ warstw jest zapisywany przy zamknięciu i odtwarzany przy następnym uruchomieniu.")
+        print(f"8. Powtórka: 'Nagrywaj powtórkę' przechowuje w pamięci ostatnie {REPLAY_SECONDS} s obrazu wyjściowego (maks. {REPLAY_MAX_MEMORY_MB} MB).")
+        print("   - Gdy nagrywanie jest wyłączone, bufor nie obciąża renderowania.")
+        print("   - 'Dodaj warstwę powtórki' odtwarza w pętli wybraną liczbę ostatnich sekund jako nową warstwę.")
+        print("   - 'Eksportuj powtórkę' zapisuje zawartość bufora do pliku wideo.")
+        print("9. Opóźnienia: 'Raport opóźnień' (lub GET /latency w API) pokazuje wiek warstw w chwili wyświetlenia dla każdego wyjścia.")
+        print("   - 'Test opóźnienia' dodaje syntetyczną warstwę z zakodowanym licznikiem klatek i mierzy opóźnienie od przechwycenia do wyjścia.")
+        print("10. 'Izoluj przechwytywanie' uruchamia każdą kamerę i region ekranu w osobnym procesie.")
+        print("   - Zawieszony lub uszkodzony proces jest restartowany, a warstwa pokazuje ostatnią klatkę z oznaczeniem 'BRAK SYGNALU'.")
+        print("11. 'Kolor warstwy...' ustawia jasność, kontrast, gammę, nasycenie i temperaturę barwową wybranej warstwy.")
+        print("   - Ustawienia są zapisywane w scenach i dostępne w API jako pole 'color'.")
+        print("12. 'Tło kamery...' rozmywa lub usuwa tło wybranej warstwy kamery (pole 'matting' w API).")
+        print(f"   - Maska jest liczona w tle w niskiej rozdzielczości, w budżecie {MATTING_FRAME_BUDGET_MS:g} ms na klatkę.")
 
     def init_ui(self):
         self.central_widget = QWidget()
@@ -213,6 +1400,13 @@ class CameraScreenOverlayApp(QMainWindow):
         self.add_roi_layer_button = QPushButton("Dodaj warstwę z ROI")
         self.add_roi_layer_button.clicked.connect(self.start_roi_selection_for_new_layer)
         self.control_layout.addWidget(self.add_roi_layer_button)
+        self.network_stream_button = QPushButton("Włącz strumień LAN")
+        self.network_stream_button.clicked.connect(self.toggle_network_stream)
+        self.control_layout.addWidget(self.network_stream_button)
+        self.isolated_capture_button = QPushButton()
+        self.isolated_capture_button.clicked.connect(self.toggle_isolated_capture)
+        self.update_isolated_capture_button()
+        self.control_layout.addWidget(self.isolated_capture_button)
         self.control_layout.addStretch(1)
         self.layer_management_panel = QWidget()
         self.layer_management_layout = QHBoxLayout(self.layer_management_panel)
@@ -240,7 +1434,48 @@ class CameraScreenOverlayApp(QMainWindow):
         self.remove_layer_button = QPushButton("Usuń warstwę")
         self.remove_layer_button.clicked.connect(self.remove_selected_layer)
         self.layer_management_layout.addWidget(self.remove_layer_button)
+        self.layer_color_button = QPushButton("Kolor warstwy...")
+        self.layer_color_button.clicked.connect(self.edit_selected_layer_color)
+        self.layer_management_layout.addWidget(self.layer_color_button)
+        self.layer_matting_button = QPushButton("Tło kamery...")
+        self.layer_matting_button.clicked.connect(self.edit_selected_layer_matting)
+        self.layer_management_layout.addWidget(self.layer_matting_button)
         self.layer_management_layout.addStretch(1)
+        self.scene_panel = QWidget()
+        self.scene_layout = QHBoxLayout(self.scene_panel)
+        self.main_layout.addWidget(self.scene_panel)
+        self.scenes_label = QLabel("Sceny:")
+        self.scenes_combobox = QComboBox()
+        self.scene_layout.addWidget(self.scenes_label)
+        self.scene_layout.addWidget(self.scenes_combobox)
+        self.load_scene_button = QPushButton("Wczytaj scenę")
+        self.load_scene_button.clicked.connect(self.load_selected_scene)
+        self.scene_layout.addWidget(self.load_scene_button)
+        self.save_scene_button = QPushButton("Zapisz scenę")
+        self.save_scene_button.clicked.connect(self.save_current_scene)
+        self.scene_layout.addWidget(self.save_scene_button)
+        self.remove_scene_button = QPushButton("Usuń scenę")
+        self.remove_scene_button.clicked.connect(self.remove_selected_scene)
+        self.scene_layout.addWidget(self.remove_scene_button)
+        self.replay_label = QLabel("Powtórka:")
+        self.scene_layout.addWidget(self.replay_label)
+        self.replay_recording_button = QPushButton()
+        self.replay_recording_button.clicked.connect(self.toggle_replay_recording)
+        self.update_replay_recording_button()
+        self.scene_layout.addWidget(self.replay_recording_button)
+        self.add_replay_layer_button = QPushButton("Dodaj warstwę powtórki")
+        self.add_replay_layer_button.clicked.connect(self.add_replay_layer)
+        self.scene_layout.addWidget(self.add_replay_layer_button)
+        self.export_replay_button = QPushButton("Eksportuj powtórkę")
+        self.export_replay_button.clicked.connect(self.export_replay)
+        self.scene_layout.addWidget(self.export_replay_button)
+        self.latency_self_test_button = QPushButton("Test opóźnienia")
+        self.latency_self_test_button.clicked.connect(self.toggle_latency_self_test)
+        self.scene_layout.addWidget(self.latency_self_test_button)
+        self.latency_report_button = QPushButton("Raport opóźnień")
+        self.latency_report_button.clicked.connect(self.print_latency_report)
+        self.scene_layout.addWidget(self.latency_report_button)
+        self.scene_layout.addStretch(1)
         self.video_label = QLabel(self)
         self.video_label.setAlignment(Qt.AlignCenter)
         self.video_label.setStyleSheet("background-color: black;")
@@ -252,10 +1487,116 @@ class CameraScreenOverlayApp(QMainWindow):
         self.video_label.mouseMoveEvent = self.preview_mouse_move_event
         self.video_label.wheelEvent = self.preview_mouse_wheel_event
         self.update_image_signal.connect(self.update_video_label)
-        self.populate_camera_combobox()
-        self.populate_app_combobox()
+        self.scene_hotkey_signal.connect(self.switch_scene)
+        self.discovery_finished_signal.connect(self.on_discovery_finished)
+        self.show_discovery_placeholders()
         self.update_layers_combobox()
 
+    def init_output_sinks(self):
+        self.get_output_profile(OUTPUT_PROFILE_PREVIEW).add_sink(self.present_preview_frame, is_async=True)
+        self.get_output_profile(OUTPUT_PROFILE_STREAM).add_sink(self.push_network_stream_frame,
+                                                                self.has_network_stream_clients, is_async=True)
+        self.get_output_profile(OUTPUT_PROFILE_REPLAY).add_sink(self.replay_buffer.push_frame,
+                                                                lambda: self.is_replay_recording, is_async=True)
+
+    def show_discovery_placeholders(self):
+        self.camera_combobox.blockSignals(True)
+        self.camera_combobox.clear()
+        self.camera_combobox.addItem("Wyszukiwanie kamer...", userData=None)
+        self.camera_combobox.setEnabled(False)
+        self.camera_combobox.blockSignals(False)
+        self.app_combobox.blockSignals(True)
+        self.app_combobox.clear()
+        self.app_combobox.addItem("Wyszukiwanie aplikacji...")
+        self.app_combobox.setEnabled(False)
+        self.app_combobox.blockSignals(False)
+        self.window_combobox.setEnabled(False)
+        self.add_roi_layer_button.setEnabled(False)
+
+    def start_deferred_services(self):
+        deferred_start_time = time.perf_counter()
+        self.start_layer_control_server()
+        self.register_scene_hotkeys()
+        STARTUP_TIMINGS["deferred_services"] = time.perf_counter() - deferred_start_time
+        prewarm_camera_indices = [] if self.isolated_capture_enabled else sorted(self.used_camera_indices())
+        threading.Thread(target=self.run_discovery, args=(prewarm_camera_indices,), name="device-discovery",
+                         daemon=True).start()
+
+    def run_discovery(self, prewarm_camera_indices):
+        discovery_start_time = time.perf_counter()
+        available_cameras = list_cameras()
+        available_processes_with_windows = get_processes_with_windows_pywin32()
+        STARTUP_TIMINGS["discovery"] = time.perf_counter() - discovery_start_time
+        camera_open_start_time = time.perf_counter()
+        opened_captures = {}
+        for camera_index in prewarm_camera_indices:
+            cap = open_video_capture(camera_index)
+            if cap is not None:
+                opened_captures[camera_index] = cap
+        STARTUP_TIMINGS["camera_open"] = time.perf_counter() - camera_open_start_time
+        self.discovery_finished_signal.emit(available_cameras, available_processes_with_windows, opened_captures)
+
+    def on_discovery_finished(self, available_cameras, available_processes_with_windows, opened_captures):
+        self.populate_camera_combobox(available_cameras)
+        self.populate_app_combobox(available_processes_with_windows)
+        self.register_prewarmed_captures(opened_captures)
+        if self.isolated_capture_enabled:
+            self.prewarm_scene_sources()
+        self.print_startup_report()
+
+    def register_prewarmed_captures(self, opened_captures):
+        used_indices = self.used_camera_indices()
+        for camera_index, cap in opened_captures.items():
+            if self.isolated_capture_enabled or camera_index in self.camera_captures or camera_index not in used_indices:
+                cap.release()
+                continue
+            self.camera_captures[camera_index] = cap
+
+    def print_startup_report(self):
+        labels = {
+            "import": "Import modułów",
+            "ui": "Budowa interfejsu",
+            "first_frame": "Pierwsza klatka (od startu procesu)",
+            "deferred_services": "Usługi odroczone (API, skróty)",
+            "discovery": "Wykrywanie kamer i okien (w tle)",
+            "camera_open": "Otwieranie kamer ze scen (w tle)",
+        }
+        print("\n--- CZAS URUCHAMIANIA ---")
+        for key, duration in list(STARTUP_TIMINGS.items()):
+            label = labels.get(key, key.replace("import ", "Import na żądanie: ", 1))
+            print(f"   - {label}: {duration * 1000:.0f} ms")
+
+    def start_layer_control_server(self):
+        network_servers = lazy_import("network_servers")
+        self.layer_control_server = network_servers.LayerControlServer(CONTROL_API_BIND_ADDRESS, CONTROL_API_PORT,
+                                                                       CONTROL_API_TIMEOUT)
+        try:
+            self.layer_control_server.start()
+        except OSError as e:
+            print(f"Ostrzeżenie: Nie można uruchomić API sterowania warstwami: {e}")
+            self.layer_control_server = None
+
+    def get_screen_capture(self):
+        if self.screen_capture_instance is None:
+            self.screen_capture_instance = lazy_import("mss").mss()
+        return self.screen_capture_instance
+
+    def present_preview_frame(self, frame, on_presented):
+        self.preview_presented_callback = on_presented
+        self.update_image_signal.emit(frame)
+
+    def has_network_stream_clients(self):
+        return self.network_stream_output is not None and self.network_stream_output.has_clients()
+
+    def push_network_stream_frame(self, frame, on_sent=None):
+        self.network_stream_output.push_frame(frame, on_sent)
+
+    def get_output_profile(self, name):
+        for output in self.output_profiles:
+            if output.name == name:
+                return output
+        return None
+
     def init_camera_layer(self):
         cam_width = 200
         cam_height = 200
@@ -281,12 +1622,11 @@ class CameraScreenOverlayApp(QMainWindow):
             self.image_states.remove(layer_to_remove)
             if layer_id == self.active_camera_layer_id:
                 self.active_camera_layer_id = None
-                if self.cap and self.cap.isOpened():
-                    self.cap.release()
-                    self.cap = None
                 self.camera_combobox.setCurrentIndex(
                     self.camera_combobox.findData(None)
                 )
+            if layer_to_remove.source_type in (SOURCE_TYPE_CAMERA, SOURCE_TYPE_SCREEN_REGION):
+                self.release_unused_capture_sources()
             self.update_layers_combobox()
 
     def get_layer_by_id(self, layer_id):
@@ -438,18 +1778,109 @@ class CameraScreenOverlayApp(QMainWindow):
                     self.remove_layer(selected_layer_id)
                     print(f"Warstwa '{layer.name}' usunięta.")
 
-    def populate_camera_combobox(self):
+    def edit_selected_layer_color(self):
+        selected_layer_id = self.layers_combobox.currentData()
+        if selected_layer_id:
+            layer = self.get_layer_by_id(selected_layer_id)
+            if layer:
+                dialog = ColorAdjustmentDialog(layer, self)
+                if dialog.exec() == QDialog.Accepted:
+                    settings = ", ".join(f"{COLOR_ADJUSTMENT_LABELS[name]}: {value:g}"
+                                         for name, value in layer.color_adjustment.to_dict().items())
+                    print(f"Warstwa '{layer.name}' kolor: {settings}")
+
+    def edit_selected_layer_matting(self):
+        selected_layer_id = self.layers_combobox.currentData()
+        if selected_layer_id:
+            layer = self.get_layer_by_id(selected_layer_id)
+            if layer:
+                if layer.source_type != SOURCE_TYPE_CAMERA:
+                    QMessageBox.warning(self, "Błąd", "Wycinanie tła jest dostępne tylko dla warstw kamery.", QMessageBox.Ok)
+                    return
+                labels = [MATTING_MODE_LABELS[mode] for mode in MATTING_MODES]
+                label, ok = QInputDialog.getItem(self, "Tło kamery", "Tryb tła:", labels,
+                                                 MATTING_MODES.index(layer.matting_mode), False)
+                if ok:
+                    self.set_layer_matting_mode(layer, MATTING_MODES[labels.index(label)])
+                    print(f"Warstwa '{layer.name}' tło: {label}")
+
+    def set_layer_matting_mode(self, layer, mode):
+        layer.matting_mode = mode
+        if mode == MATTING_MODE_OFF:
+            layer.matting = None
+
+    def toggle_network_stream(self):
+        if self.network_stream_output is None:
+            network_servers = lazy_import("network_servers")
+            self.network_stream_output = network_servers.NetworkStreamOutput(
+                STREAM_BIND_ADDRESS, STREAM_HTTP_PORT, STREAM_TCP_PORT, STREAM_CLIENT_QUEUE_SIZE,
+                lambda: FrameEncoderPool(STREAM_ENCODER_WORKERS, STREAM_JPEG_QUALITY))
+        if self.network_stream_output.is_running:
+            self.network_stream_output.stop()
+            self.network_stream_button.setText("Włącz strumień LAN")
+            return
+        try:
+            self.network_stream_output.start()
+        except OSError as e:
+            QMessageBox.warning(self, "Błąd", f"Nie można uruchomić strumienia sieciowego: {e}", QMessageBox.Ok)
+            return
+        self.network_stream_button.setText("Wyłącz strumień LAN")
+
+    def toggle_isolated_capture(self):
+        self.release_all_capture_sources()
+        self.isolated_capture_enabled = not self.isolated_capture_enabled
+        self.update_isolated_capture_button()
+        self.prewarm_scene_sources()
+        if self.isolated_capture_enabled:
+            print("Przechwytywanie kamer i regionów ekranu działa w osobnych procesach.")
+        else:
+            print("Przechwytywanie kamer i regionów ekranu działa w procesie aplikacji.")
+
+    def update_isolated_capture_button(self):
+        if self.isolated_capture_enabled:
+            self.isolated_capture_button.setText("Wyłącz izolację przechwytywania")
+        else:
+            self.isolated_capture_button.setText("Izoluj przechwytywanie")
+
+    def release_all_capture_sources(self):
+        self.warm_camera_drainer.set_idle_captures({})
+        for camera_index, cap in self.camera_captures.items():
+            self.warm_camera_drainer.release(camera_index, cap)
+        self.camera_captures = {}
+        for screen_capture_source in self.screen_capture_sources.values():
+            screen_capture_source.release()
+        self.screen_capture_sources = {}
+
+    def get_screen_capture_source(self, region, name):
+        region_key = screen_region_key(region)
+        screen_capture_source = self.screen_capture_sources.get(region_key)
+        if screen_capture_source is not None:
+            return screen_capture_source
+        capture_workers = lazy_import("capture_workers")
+        screen_capture_source = capture_workers.IsolatedCaptureSource(
+            capture_workers.CAPTURE_SOURCE_SCREEN_REGION, dict(region), name,
+            self.quality_governor.level["screen_capture_interval"] / MASTER_FPS,
+            max(1, region["width"] * region["height"] * 3))
+        self.screen_capture_sources[region_key] = screen_capture_source
+        return screen_capture_source
+
+    def populate_camera_combobox(self, available_cameras):
+        self.camera_combobox.blockSignals(True)
         self.camera_combobox.clear()
-        self.available_cameras = list_cameras()
+        self.available_cameras = available_cameras
         self.camera_combobox.addItem("-- Wybierz kamerę --", userData=None)
         if not self.available_cameras:
             self.camera_combobox.setEnabled(False)
+            self.camera_combobox.blockSignals(False)
             print("Brak dostępnych kamer.")
             return
         for i in self.available_cameras:
             self.camera_combobox.addItem(f"Kamera {i}", userData=i)
         self.camera_combobox.setEnabled(True)
-        self.camera_combobox.setCurrentIndex(0)
+        camera_layer = self.get_layer_by_id(self.active_camera_layer_id)
+        selected_camera_index = camera_layer.camera_index if camera_layer else None
+        self.camera_combobox.setCurrentIndex(max(0, self.camera_combobox.findData(selected_camera_index)))
+        self.camera_combobox.blockSignals(False)
 
     def select_camera_source(self, index):
         camera_index = self.camera_combobox.itemData(index)
@@ -466,56 +1897,335 @@ class CameraScreenOverlayApp(QMainWindow):
             self.active_camera_layer_id = new_cam_state.id
             camera_layer = new_cam_state
             print("Utworzono nową warstwę 'Kamera' po wyborze kamery.")
-        if self.cap and self.cap.isOpened():
-            self.cap.release()
-            self.cap = None
-            print("Poprzednia kamera zwolniona.")
         if camera_layer:
             if camera_index is None:
                 camera_layer.original_image = None
                 camera_layer.camera_index = None
+                self.release_unused_capture_sources()
                 print("Nie wybrano kamery. Warstwa kamery jest pusta.")
                 return
-            self.cap = cv2.VideoCapture(camera_index, cv2.CAP_DSHOW)
-            if not self.cap.isOpened():
-                print(f"Błąd: Nie można otworzyć kamery o indeksie {camera_index}. Upewnij się, że nie jest używana przez inną aplikację.")
-                self.cap = None
+            cap = self.open_camera_capture(camera_index)
+            if cap is None:
                 camera_layer.original_image = None
                 camera_layer.camera_index = None
+                self.release_unused_capture_sources()
                 return
-            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, DEFAULT_CAM_WIDTH)
-            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, DEFAULT_CAM_HEIGHT)
-            ret, frame_camera = self.cap.read()
-            if ret:
-                actual_cam_height, actual_cam_width, _ = frame_camera.shape
-                print(f"Kamera {camera_index} otwarta. Rzeczywista rozdzielczość: {actual_cam_width}x{actual_cam_height}")
-                camera_layer.aspect_ratio = actual_cam_width / actual_cam_height if actual_cam_height > 0 else 1.0
+            if self.isolated_capture_enabled:
                 camera_layer.camera_index = camera_index
-                camera_layer.original_image = cv2.flip(frame_camera, 1)
-                if camera_layer.aspect_ratio > 0:
-                    current_display_width = max(MIN_LAYER_SIZE, camera_layer.display_width)
-                    camera_layer.display_height = int(current_display_width / camera_layer.aspect_ratio)
-                    camera_layer.display_height = max(MIN_LAYER_SIZE, camera_layer.display_height)
+                if cap.frame is not None and not cap.is_stale:
+                    camera_layer.original_image = cap.frame
+                    self.fit_camera_layer_to_frame(camera_layer, cap.frame)
                 else:
-                    camera_layer.display_height = camera_layer.display_width
-                print(f"Warstwa kamery ustawiona na rozmiar: {camera_layer.display_width}x{camera_layer.display_height}")
+                    camera_layer.original_image = None
+                    camera_layer.is_awaiting_camera_frame = True
+                    print(f"Kamera {camera_index} uruchamia się w osobnym procesie. Obraz pojawi się po pierwszej klatce.")
+                self.release_unused_capture_sources()
+                return
+            ret, frame_camera = self.warm_camera_drainer.read(camera_index, cap)
+            if ret:
+                frame_camera = cv2.flip(frame_camera, 1)
+                camera_layer.camera_index = camera_index
+                camera_layer.original_image = frame_camera
+                self.fit_camera_layer_to_frame(camera_layer, frame_camera)
             else:
                 print(f"Błąd: Kamera {camera_index} zwróciła pustą klatkę podczas inicjalizacji. Sprawdź, czy kamera jest używana przez inną aplikację.")
-                self.cap.release()
-                self.cap = None
                 camera_layer.original_image = None
                 camera_layer.camera_index = None
+            self.release_unused_capture_sources()
         else:
             print("Nie wybrano kamery lub nie znaleziono warstwy kamery do przypisania źródła.")
 
-    def populate_app_combobox(self):
+    def fit_camera_layer_to_frame(self, camera_layer, frame_camera):
+        camera_layer.is_awaiting_camera_frame = False
+        actual_cam_height, actual_cam_width = frame_camera.shape[:2]
+        print(f"Kamera {camera_layer.camera_index} otwarta. Rzeczywista rozdzielczość: {actual_cam_width}x{actual_cam_height}")
+        camera_layer.aspect_ratio = actual_cam_width / actual_cam_height if actual_cam_height > 0 else 1.0
+        if camera_layer.aspect_ratio > 0:
+            current_display_width = max(MIN_LAYER_SIZE, camera_layer.display_width)
+            camera_layer.display_height = int(current_display_width / camera_layer.aspect_ratio)
+            camera_layer.display_height = max(MIN_LAYER_SIZE, camera_layer.display_height)
+        else:
+            camera_layer.display_height = camera_layer.display_width
+        print(f"Warstwa kamery ustawiona na rozmiar: {camera_layer.display_width}x{camera_layer.display_height}")
+
+    def open_camera_capture(self, camera_index):
+        cap = self.camera_captures.get(camera_index)
+        if cap is not None and cap.isOpened():
+            return cap
+        if self.isolated_capture_enabled:
+            capture_workers = lazy_import("capture_workers")
+            cap = capture_workers.IsolatedCaptureSource(capture_workers.CAPTURE_SOURCE_CAMERA,
+                                                        (camera_index, DEFAULT_CAM_WIDTH, DEFAULT_CAM_HEIGHT),
+                                                        f"Kamera {camera_index}")
+            self.camera_captures[camera_index] = cap
+            return cap
+        cap = open_video_capture(camera_index)
+        if cap is not None:
+            self.camera_captures[camera_index] = cap
+        return cap
+
+    def used_layers_data(self):
+        layers = [layer_state.to_scene_dict() for layer_state in self.image_states]
+        for scene in self.scenes_data["scenes"].values():
+            layers.extend(scene["layers"])
+        return layers
+
+    def used_camera_indices(self):
+        return {layer["camera_index"] for layer in self.used_layers_data()
+                if layer.get("source_type") == SOURCE_TYPE_CAMERA and layer.get("camera_index") is not None}
+
+    def used_screen_regions(self):
+        screen_regions = {}
+        for layer in self.used_layers_data():
+            if layer.get("source_type") == SOURCE_TYPE_SCREEN_REGION and layer.get("screen_region"):
+                screen_regions.setdefault(screen_region_key(layer["screen_region"]), (layer["screen_region"], layer["name"]))
+        return screen_regions
+
+    def release_unused_capture_sources(self):
+        used_indices = self.used_camera_indices()
+        for camera_index in list(self.camera_captures):
+            if camera_index not in used_indices:
+                self.warm_camera_drainer.release(camera_index, self.camera_captures.pop(camera_index))
+                print(f"Kamera {camera_index} zwolniona.")
+        used_screen_regions = self.used_screen_regions()
+        for region_key in list(self.screen_capture_sources):
+            if region_key not in used_screen_regions:
+                self.screen_capture_sources.pop(region_key).release()
+
+    def prewarm_scene_sources(self):
+        for camera_index in sorted(self.used_camera_indices()):
+            self.open_camera_capture(camera_index)
+        if self.isolated_capture_enabled:
+            for region, name in self.used_screen_regions().values():
+                self.get_screen_capture_source(region, name)
+
+    def toggle_replay_recording(self):
+        self.is_replay_recording = not self.is_replay_recording
+        self.update_replay_recording_button()
+        if self.is_replay_recording:
+            print(f"Nagrywanie powtórki włączone (ostatnie {REPLAY_SECONDS} s).")
+        else:
+            print("Nagrywanie powtórki wyłączone. Zawartość bufora pozostaje dostępna.")
+
+    def update_replay_recording_button(self):
+        if self.is_replay_recording:
+            self.replay_recording_button.setText("Zatrzymaj nagrywanie powtórki")
+        else:
+            self.replay_recording_button.setText("Nagrywaj powtórkę")
+
+    def add_replay_layer(self):
+        time_range = self.replay_buffer.time_range()
+        if time_range is None or time_range[1] - time_range[0] < 1.0:
+            QMessageBox.warning(self, "Błąd", "Bufor powtórki jest pusty. Włącz 'Nagrywaj powtórkę' i poczekaj chwilę.", QMessageBox.Ok)
+            return
+        available_seconds = max(1, int(time_range[1] - time_range[0]))
+        seconds, ok = QInputDialog.getInt(self, "Powtórka", "Ile ostatnich sekund odtworzyć?",
+                                          min(REPLAY_DEFAULT_CLIP_SECONDS, available_seconds), 1, available_seconds)
+        if not ok:
+            return
+        replay_profile = self.get_output_profile(OUTPUT_PROFILE_REPLAY)
+        target_width = max(MIN_LAYER_SIZE, int(self.video_label.width() * 0.4))
+        target_height = max(MIN_LAYER_SIZE, int(target_width * replay_profile.height / replay_profile.width))
+        new_layer = ImageState(f"Powtórka: ostatnie {seconds} s", SOURCE_TYPE_REPLAY,
+                               target_width, target_height,
+                               self.video_label.width() - target_width, 0, is_visible=True)
+        new_layer.replay_playback = ReplayPlayback(self.replay_buffer, time_range[1] - seconds, time_range[1])
+        self.add_layer(new_layer)
+        print(f"Dodano warstwę powtórki: ostatnie {seconds} s.")
+
+    def toggle_latency_self_test(self):
+        test_pattern_layers = [layer_state for layer_state in self.image_states
+                               if layer_state.source_type == SOURCE_TYPE_TEST_PATTERN]
+        if test_pattern_layers:
+            for layer_state in test_pattern_layers:
+                self.image_states.remove(layer_state)
+            self.update_layers_combobox()
+            self.print_latency_report()
+            return
+        for output in self.output_profiles:
+            output.reset_latency()
+        pattern_width = SELF_TEST_CELL_SIZE * (SELF_TEST_BITS + 2)
+        test_pattern_layer = ImageState("Test opóźnienia", SOURCE_TYPE_TEST_PATTERN,
+                                        pattern_width, SELF_TEST_CELL_SIZE, 0, 0, is_visible=True)
+        test_pattern_layer.aspect_ratio = self.latency_self_test.aspect_ratio
+        self.add_layer(test_pattern_layer)
+        print("Test opóźnienia włączony: licznik klatek jest rysowany w lewym górnym rogu i odczytywany z każdego wyjścia.")
+
+    def latency_report(self):
+        return {output.name: output.latency_report() for output in self.output_profiles}
+
+    def print_latency_report(self):
+        print("\n--- RAPORT OPÓŹNIEŃ ---")
+        for output in self.output_profiles:
+            with output.latency_lock:
+                print(f"Wyjście '{output.name}' (wysłane klatki: {output.delivered_frames}, "
+                      f"pomiar w chwili: {OUTPUT_PRESENTATION_POINTS.get(output.name, 'przekazania klatki')}):")
+                print(f"   - wiek najstarszej warstwy: {output.oldest_layer_age_histogram.describe()}")
+                print(f"   - wiek najnowszej warstwy: {output.newest_layer_age_histogram.describe()}")
+                print(f"   - test opóźnienia (przechwycenie -> wyjście): {output.self_test_histogram.describe()}")
+
+    def export_replay(self):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), time.strftime("replay_%Y%m%d_%H%M%S.mp4"))
+        if not self.replay_buffer.export(path):
+            QMessageBox.warning(self, "Błąd", "Bufor powtórki jest pusty. Włącz 'Nagrywaj powtórkę' i poczekaj chwilę.", QMessageBox.Ok)
+            return
+        print(f"Eksport powtórki do pliku '{path}' rozpoczęty.")
+
+    def update_scenes_combobox(self):
+        self.scenes_combobox.clear()
+        scene_names = list(self.scenes_data["scenes"])
+        for scene_name in scene_names:
+            hotkey = self.scenes_data["scenes"][scene_name].get("hotkey")
+            label = f"{scene_name} ({hotkey})" if hotkey else scene_name
+            self.scenes_combobox.addItem(label, userData=scene_name)
+        has_scenes = bool(scene_names)
+        if not has_scenes:
+            self.scenes_combobox.addItem("Brak scen")
+        elif self.active_scene_name in scene_names:
+            self.scenes_combobox.setCurrentIndex(self.scenes_combobox.findData(self.active_scene_name))
+        self.scenes_combobox.setEnabled(has_scenes)
+        self.load_scene_button.setEnabled(has_scenes)
+        self.remove_scene_button.setEnabled(has_scenes)
+
+    def next_free_scene_hotkey(self):
+        used_hotkeys = {scene.get("hotkey") for scene in self.scenes_data["scenes"].values()}
+        for number in range(1, MAX_SCENE_HOTKEYS + 1):
+            hotkey = SCENE_HOTKEY_TEMPLATE.format(number)
+            if hotkey not in used_hotkeys:
+                return hotkey
+        return None
+
+    def save_current_scene(self):
+        default_name = self.active_scene_name or f"Scena {len(self.scenes_data['scenes']) + 1}"
+        scene_name, ok = QInputDialog.getText(self, "Zapisz scenę", "Nazwa sceny:", text=default_name)
+        scene_name = scene_name.strip()
+        if not ok or not scene_name:
+            return
+        existing_scene = self.scenes_data["scenes"].get(scene_name)
+        hotkey = existing_scene.get("hotkey") if existing_scene else self.next_free_scene_hotkey()
+        self.scenes_data["scenes"][scene_name] = {
+            "hotkey": hotkey,
+            "layers": self.persistent_layers_data(),
+        }
+        self.active_scene_name = scene_name
+        save_scenes_file(self.scenes_data)
+        self.update_scenes_combobox()
+        self.register_scene_hotkeys()
+        print(f"Scena '{scene_name}' zapisana" + (f" (skrót: {hotkey})." if hotkey else "."))
+
+    def load_selected_scene(self):
+        scene_name = self.scenes_combobox.currentData()
+        if scene_name:
+            self.switch_scene(scene_name)
+
+    def remove_selected_scene(self):
+        scene_name = self.scenes_combobox.currentData()
+        if not scene_name:
+            return
+        reply = QMessageBox.question(self, 'Usuń Scenę',
+                                     f"Czy na pewno chcesz usunąć scenę '{scene_name}'?",
+                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return
+        del self.scenes_data["scenes"][scene_name]
+        if self.active_scene_name == scene_name:
+            self.active_scene_name = None
+        save_scenes_file(self.scenes_data)
+        self.update_scenes_combobox()
+        self.register_scene_hotkeys()
+        self.release_unused_capture_sources()
+        print(f"Scena '{scene_name}' usunięta.")
+
+    def switch_scene(self, scene_name):
+        scene = self.scenes_data["scenes"].get(scene_name)
+        if scene is None:
+            print(f"Nie znaleziono sceny '{scene_name}'.")
+            return
+        switch_start_time = time.perf_counter()
+        self.apply_layout(scene["layers"])
+        self.active_scene_name = scene_name
+        self.update_scenes_combobox()
+        print(f"Przełączono na scenę '{scene_name}' w {(time.perf_counter() - switch_start_time) * 1000:.1f} ms.")
+
+    def persistent_layers_data(self):
+        return [layer_state.to_scene_dict() for layer_state in self.image_states
+                if layer_state.source_type not in TRANSIENT_SOURCE_TYPES]
+
+    def apply_layout(self, layers_data, open_cameras=True):
+        new_image_states = []
+        for layer_data in layers_data:
+            if isinstance(layer_data, dict) and layer_data.get("source_type") in TRANSIENT_SOURCE_TYPES:
+                continue
+            try:
+                new_image_states.append(layer_state_from_scene_dict(layer_data))
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Ostrzeżenie: Pominięto nieprawidłową warstwę w scenie: {e}")
+        current_layers = {layer_state.id: layer_state for layer_state in self.image_states}
+        for layer_state in new_image_states:
+            current_layer = current_layers.get(layer_state.id)
+            if current_layer is not None:
+                layer_state.original_image = current_layer.original_image
+                layer_state.replay_playback = current_layer.replay_playback
+                layer_state.matting = current_layer.matting
+            if open_cameras and layer_state.source_type == SOURCE_TYPE_CAMERA and layer_state.camera_index is not None:
+                if self.open_camera_capture(layer_state.camera_index) is None:
+                    layer_state.camera_index = None
+        self.active_draggable_image_state = None
+        self.active_resizable_image_state = None
+        self.resize_handle_active = None
+        self.image_states = new_image_states
+        camera_layers = [layer_state for layer_state in self.image_states if layer_state.source_type == SOURCE_TYPE_CAMERA]
+        self.active_camera_layer_id = camera_layers[0].id if camera_layers else None
+        camera_index = camera_layers[0].camera_index if camera_layers else None
+        self.camera_combobox.blockSignals(True)
+        self.camera_combobox.setCurrentIndex(max(0, self.camera_combobox.findData(camera_index)))
+        self.camera_combobox.blockSignals(False)
+        self.update_layers_combobox()
+        self.release_unused_capture_sources()
+
+    def restore_last_layout(self, open_cameras=True):
+        last_layout = self.scenes_data.get("last_layout")
+        if not last_layout or not last_layout.get("layers"):
+            return False
+        self.active_scene_name = last_layout.get("scene")
+        self.apply_layout(last_layout["layers"], open_cameras)
+        self.update_scenes_combobox()
+        print("Odtworzono układ warstw z poprzedniej sesji.")
+        return True
+
+    def save_last_layout(self):
+        self.scenes_data["version"] = SCENES_FILE_VERSION
+        self.scenes_data["last_layout"] = {
+            "scene": self.active_scene_name,
+            "layers": self.persistent_layers_data(),
+        }
+        save_scenes_file(self.scenes_data)
+
+    def register_scene_hotkeys(self):
+        if not load_keyboard():
+            return
+        for hotkey_handle in self.registered_scene_hotkeys:
+            try:
+                keyboard.remove_hotkey(hotkey_handle)
+            except (KeyError, ValueError):
+                pass
+        self.registered_scene_hotkeys = []
+        for scene_name, scene in self.scenes_data["scenes"].items():
+            hotkey = scene.get("hotkey")
+            if not hotkey:
+                continue
+            try:
+                self.registered_scene_hotkeys.append(
+                    keyboard.add_hotkey(hotkey, self.scene_hotkey_signal.emit, args=(scene_name,)))
+            except Exception as e:
+                print(f"Ostrzeżenie: Nie można zarejestrować skrótu '{hotkey}' dla sceny '{scene_name}': {e}")
+
+    def populate_app_combobox(self, available_processes_with_windows):
         self.app_combobox.clear()
         self.window_combobox.clear()
         self.window_combobox.setEnabled(False)
         self.add_roi_layer_button.setEnabled(False)
-        self.available_processes_with_windows = []
-        if HAS_WIN32:
-            self.available_processes_with_windows = get_processes_with_windows_pywin32()
+        self.available_processes_with_windows = available_processes_with_windows
         if not self.available_processes_with_windows:
             self.app_combobox.addItem("Brak dostępnych aplikacji")
             self.app_combobox.setEnabled(False)
@@ -561,172 +2271,378 @@ class CameraScreenOverlayApp(QMainWindow):
             print("Nie wybrano konkretnego okna.")
 
     def start_roi_selection_for_new_layer(self):
-        if self.is_roi_selection_active:
+        if self.roi_selection_dialog is not None:
             print("Tryb zaznaczania ROI jest już aktywny.")
+            self.roi_selection_dialog.raise_()
+            self.roi_selection_dialog.activateWindow()
             return
-        if not HAS_WIN32:
+        if not load_win32():
             QMessageBox.warning(self, "Błąd", "Pywin32 nie jest zainstalowane. Ta funkcja wymaga pywin32 na Windowsie.", QMessageBox.Ok)
             return
         if not self.selected_app_window_info_for_new_layer:
             QMessageBox.warning(self, "Błąd", "Proszę najpierw wybrać aplikację i okno do zaznaczenia ROI.", QMessageBox.Ok)
             return
-        self.is_roi_selection_active = True
-        self.hide()
-        roi_result = self._draw_roi_on_selected_window(self.selected_app_window_info_for_new_layer)
-        self.show()
-        self.is_roi_selection_active = False
-        if roi_result:
-            selected_region, window_info = roi_result
-            new_layer_name = f"Ekran: {window_info['title']}"
-            target_width = int(self.video_label.width() * 0.5)
-            target_height = int(target_width / (selected_region['width'] / selected_region['height']) if selected_region['height'] > 0 else target_width)
-            target_width = max(MIN_LAYER_SIZE, target_width)
-            target_height = max(MIN_LAYER_SIZE, target_height)
-            initial_x = (self.video_label.width() - target_width) // 2
-            initial_y = (self.video_label.height() - target_height) // 2
-            new_layer = ImageState(
-                name=new_layer_name,
-                source_type=SOURCE_TYPE_SCREEN_REGION,
-                initial_width=target_width,
-                initial_height=target_height,
-                initial_x=initial_x,
-                initial_y=initial_y,
-                is_visible=True,
-                screen_region=selected_region
-            )
-            new_layer.selected_app_window_info = window_info
-            new_layer.aspect_ratio = selected_region['width'] / selected_region['height'] if selected_region['height'] > 0 else 1.0
-            self.add_layer(new_layer)
-            QMessageBox.information(self, "Sukces", f"Dodano nową warstwę: '{new_layer_name}'", QMessageBox.Ok)
-        else:
-            QMessageBox.warning(self, "Anulowano", "Zaznaczenie obszaru ROI zostało anulowane.", QMessageBox.Ok)
-
-    def _draw_roi_on_selected_window(self, app_window_info):
-        print(f"\n--- ZAZNACZANIE OBSZARU W WYBRANYM OKNIE '{app_window_info['title']}' ---")
-        print("Zaznacz myszką prostokątny obszar w tym oknie,")
-        print("a następnie naciśnij 'ENTER' lub 'SPACE' aby zatwierdzić.")
-        print("Naciśnij 'C' aby anulować zaznaczenie.")
-        local_sct = mss.mss()
-        app_window_region_coords = {
-            "top": app_window_info['top'],
-            "left": app_window_info['left'],
-            "width": app_window_info['width'],
-            "height": app_window_info['height'],
-        }
-        if app_window_region_coords["width"] <= 0 or app_window_region_coords["height"] <= 0:
+        app_window_info = self.selected_app_window_info_for_new_layer
+        if app_window_info['width'] <= 0 or app_window_info['height'] <= 0:
             print("Błąd: Wybrane okno ma zerowe lub ujemne wymiary. Nie można wykonać zrzutu. Spróbuj wybrać inne okno.")
-            return None
-        try:
-            sct_img = local_sct.grab(app_window_region_coords)
-            if sct_img is None or not sct_img.pixels:
-                print("Błąd: Zrzut wybranego okna jest pusty. Upewnij się, że okno jest widoczne i aktywne.")
-                return None
-            window_np = np.array(sct_img)[:, :, :3]
-            print("Pomyślnie wykonano zrzut wybranego okna do zaznaczenia ROI.")
-        except mss.exception.ScreenShotError as e:
-            print(f"Błąd podczas próby zrzutu wybranego okna (MSS): {e}. Upewnij się, że okno jest widoczne i nie jest zminimalizowane.")
-            return None
-        except Exception as e:
-            print(f"Nieoczekiwany błąd podczas przygotowania zrzutu okna: {e}. Anuluję.")
-            return None
-        roi_window_title = f"Zaznacz obszar do przechwycenia w: '{app_window_info['title']}'"
-        cv2.namedWindow(roi_window_title, cv2.WINDOW_NORMAL)
-        if HAS_WIN32:
-            roi_hwnd = None
-            for _ in range(20):
-                roi_hwnd = win32gui.FindWindow(None, roi_window_title)
-                if roi_hwnd:
-                    break
-                time.sleep(0.1)
-            if roi_hwnd:
-                try:
-                    win32gui.ShowWindow(roi_hwnd, win32con.SW_RESTORE)
-                    win32gui.SetForegroundWindow(roi_hwnd)
-                    print(f"Ustawiono fokus na oknie: '{roi_window_title}' (HW ID: {roi_hwnd})")
-                except Exception as e:
-                    print(f"Ostrzeżenie: Nie udało się ustawić fokusu na oknie ROI: {e}")
+            return
+        print(f"\n--- ZAZNACZANIE OBSZARU W WYBRANYM OKNIE '{app_window_info['title']}' ---")
+        print("Zaznacz myszką prostokątny obszar w oknie podglądu zaznaczania,")
+        print("a następnie naciśnij 'ENTER' lub 'OK' aby zatwierdzić. 'ESC' anuluje zaznaczenie.")
+        self.roi_selection_dialog = RoiSelectionDialog(app_window_info, self)
+        self.roi_selection_dialog.roi_selected.connect(self.on_roi_selected)
+        self.roi_selection_dialog.roi_cancelled.connect(self.on_roi_selection_cancelled)
+        self.roi_preview_source = self.create_roi_preview_source(self.roi_selection_dialog.capture_region)
+        self.roi_selection_dialog.show()
+
+    def create_roi_preview_source(self, region):
+        capture_workers = lazy_import("capture_workers")
+        frame_interval = ROI_PREVIEW_FRAME_INTERVAL / MASTER_FPS
+        if self.isolated_capture_enabled:
+            return capture_workers.IsolatedCaptureSource(
+                capture_workers.CAPTURE_SOURCE_SCREEN_REGION, dict(region), "Podgląd ROI", frame_interval,
+                max(1, region["width"] * region["height"] * 3))
+        return capture_workers.ThreadedCaptureSource(capture_workers.CAPTURE_SOURCE_SCREEN_REGION, dict(region),
+                                                     "Podgląd ROI", frame_interval)
+
+    def on_roi_selected(self, selected_region, window_info):
+        self._close_roi_selection_dialog()
+        print(f"Zaznaczono obszar (GLOBALNY: {selected_region['left']},{selected_region['top']},{selected_region['width']},{selected_region['height']})")
+        new_layer_name = f"Ekran: {window_info['title']}"
+        target_width = int(self.video_label.width() * 0.5)
+        target_height = int(target_width / (selected_region['width'] / selected_region['height']) if selected_region['height'] > 0 else target_width)
+        target_width = max(MIN_LAYER_SIZE, target_width)
+        target_height = max(MIN_LAYER_SIZE, target_height)
+        initial_x = (self.video_label.width() - target_width) // 2
+        initial_y = (self.video_label.height() - target_height) // 2
+        new_layer = ImageState(
+            name=new_layer_name,
+            source_type=SOURCE_TYPE_SCREEN_REGION,
+            initial_width=target_width,
+            initial_height=target_height,
+            initial_x=initial_x,
+            initial_y=initial_y,
+            is_visible=True,
+            screen_region=selected_region
+        )
+        new_layer.selected_app_window_info = window_info
+        new_layer.aspect_ratio = selected_region['width'] / selected_region['height'] if selected_region['height'] > 0 else 1.0
+        self.add_layer(new_layer)
+        QMessageBox.information(self, "Sukces", f"Dodano nową warstwę: '{new_layer_name}'", QMessageBox.Ok)
+
+    def on_roi_selection_cancelled(self):
+        self._close_roi_selection_dialog()
+        print("Zaznaczenie ROI anulowane lub rozmiar jest zerowy.")
+        QMessageBox.warning(self, "Anulowano", "Zaznaczenie obszaru ROI zostało anulowane.", QMessageBox.Ok)
+
+    def _close_roi_selection_dialog(self):
+        if self.roi_preview_source is not None:
+            self.roi_preview_source.release()
+            self.roi_preview_source = None
+        if self.roi_selection_dialog is not None:
+            self.roi_selection_dialog.deleteLater()
+            self.roi_selection_dialog = None
+
+    def update_roi_selection_preview(self):
+        if self.roi_selection_dialog is None or self.roi_preview_source is None:
+            return
+        if self.roi_preview_source.poll() and not self.roi_preview_source.is_stale:
+            self.roi_selection_dialog.update_frame(self.roi_preview_source.frame)
+
+    def apply_pending_layer_control(self):
+        if self.layer_control_server is None:
+            return
+        network_servers = lazy_import("network_servers")
+        needs_layers_refresh = False
+        for transaction in self.layer_control_server.take_pending_transactions():
+            if not transaction.begin():
+                continue
+            result, error = None, "Wewnętrzny błąd aplikacji."
+            try:
+                if transaction.kind == network_servers.CONTROL_TRANSACTION_LATENCY:
+                    result = {"outputs": self.latency_report()}
+                else:
+                    if transaction.kind == network_servers.CONTROL_TRANSACTION_BATCH:
+                        needs_layers_refresh = self.apply_layer_updates(transaction.updates) or needs_layers_refresh
+                    layers = [layer_state.to_dict(i) for i, layer_state in enumerate(self.image_states)]
+                    result = {"applied": len(transaction.updates), "layers": layers}
+                error = None
+            except LayerControlError as e:
+                error = str(e)
+            except Exception as e:
+                print(f"Błąd API sterowania warstwami: {e}")
+            finally:
+                transaction.finish(result=result, error=error)
+        if needs_layers_refresh:
+            self.update_layers_combobox()
+
+    def apply_layer_updates(self, updates):
+        validated_updates = [self.validate_layer_update(update) for update in updates]
+        needs_layers_refresh = False
+        for layer, update in validated_updates:
+            needs_layers_refresh = self.apply_layer_update(layer, update) or needs_layers_refresh
+        return needs_layers_refresh
+
+    def validate_layer_update(self, update):
+        if not isinstance(update, dict):
+            raise LayerControlError("Każda zmiana musi być obiektem JSON.")
+        unknown_fields = sorted(set(update) - set(LAYER_UPDATE_FIELDS))
+        if unknown_fields:
+            raise LayerControlError(f"Nieznane pola: {', '.join(unknown_fields)}.")
+        layer = self.get_layer_by_id(update.get("id"))
+        if layer is None:
+            raise LayerControlError(f"Nie znaleziono warstwy o id '{update.get('id')}'.")
+        for key in ("x", "y", "width", "height"):
+            if key in update and (isinstance(update[key], bool) or not isinstance(update[key], (int, float)) or
+                                  not -MAX_LAYER_COORDINATE <= update[key] <= MAX_LAYER_COORDINATE):
+                raise LayerControlError(f"Pole '{key}' musi być liczbą w zakresie "
+                                        f"{-MAX_LAYER_COORDINATE}-{MAX_LAYER_COORDINATE}.")
+        if "visible" in update and not isinstance(update["visible"], bool):
+            raise LayerControlError("Pole 'visible' musi być wartością logiczną.")
+        if "name" in update and (not isinstance(update["name"], str) or not update["name"].strip()):
+            raise LayerControlError("Pole 'name' musi być niepustym tekstem.")
+        if "z" in update:
+            z = update["z"]
+            if isinstance(z, str):
+                if z not in LAYER_Z_KEYWORDS:
+                    raise LayerControlError(f"Pole 'z' musi być liczbą lub jednym z: {', '.join(LAYER_Z_KEYWORDS)}.")
+            elif isinstance(z, bool) or not isinstance(z, int) or not 0 <= z < len(self.image_states):
+                raise LayerControlError(f"Pole 'z' musi być w zakresie 0-{len(self.image_states) - 1}.")
+        if "color" in update:
+            color = update["color"]
+            if not isinstance(color, dict):
+                raise LayerControlError("Pole 'color' musi być obiektem JSON.")
+            unknown_color_fields = sorted(set(color) - set(COLOR_ADJUSTMENT_DEFAULTS))
+            if unknown_color_fields:
+                raise LayerControlError(f"Nieznane pola koloru: {', '.join(unknown_color_fields)}.")
+            for name, value in color.items():
+                low, high = COLOR_ADJUSTMENT_RANGES[name]
+                if isinstance(value, bool) or not isinstance(value, (int, float)) or not low <= value <= high:
+                    raise LayerControlError(f"Pole koloru '{name}' musi być liczbą w zakresie {low:g}-{high:g}.")
+        if "matting" in update:
+            if update["matting"] not in MATTING_MODES:
+                raise LayerControlError(f"Pole 'matting' musi być jednym z: {', '.join(MATTING_MODES)}.")
+            if layer.source_type != SOURCE_TYPE_CAMERA and update["matting"] != MATTING_MODE_OFF:
+                raise LayerControlError("Pole 'matting' jest dostępne tylko dla warstw kamery.")
+        return layer, update
+
+    def apply_layer_update(self, layer, update):
+        needs_layers_refresh = False
+        if "width" in update or "height" in update:
+            if "width" in update and "height" in update:
+                new_width, new_height = int(update["width"]), int(update["height"])
+            elif "width" in update:
+                new_width = int(update["width"])
+                new_height = int(new_width / layer.aspect_ratio) if layer.aspect_ratio > 0 else layer.display_height
             else:
-                print(f"Ostrzeżenie: Nie można znaleźć okna '{roi_window_title}' po jego utworzeniu.")
-        roi_rect = cv2.selectROI(roi_window_title,
-                                 window_np, fromCenter=False, showCrosshair=True)
-        cv2.destroyWindow(roi_window_title)
-        x_local, y_local, w, h = roi_rect
-        if w > 0 and h > 0:
-            x_global = app_window_info['left'] + x_local
-            y_global = app_window_info['top'] + y_local
-            if w == 0 or h == 0:
-                print("Zaznaczenie ROI anulowane lub rozmiar jest zerowy.")
-                return None
-            selected_screen_region_result = {
-                "top": y_global,
-                "left": x_global,
-                "width": w,
-                "height": h,
-            }
-            print(f"Zaznaczono obszar (Lokalny w oknie: {x_local},{y_local},{w},{h} | GLOBALNY: {x_global},{y_global},{w},{h})")
-            return selected_screen_region_result, app_window_info
-        else:
-            print("Zaznaczenie ROI anulowane lub rozmiar jest zerowy.")
-            return None
+                new_height = int(update["height"])
+                new_width = int(new_height * layer.aspect_ratio) if layer.aspect_ratio > 0 else layer.display_width
+            layer.display_width = max(MIN_LAYER_SIZE, min(MAX_LAYER_SIZE, new_width))
+            layer.display_height = max(MIN_LAYER_SIZE, min(MAX_LAYER_SIZE, new_height))
+        if "x" in update:
+            layer.x = int(update["x"])
+        if "y" in update:
+            layer.y = int(update["y"])
+        if "visible" in update and update["visible"] != layer.is_visible:
+            layer.is_visible = update["visible"]
+            needs_layers_refresh = True
+        if "name" in update and update["name"] != layer.name:
+            layer.name = update["name"]
+            needs_layers_refresh = True
+        if "color" in update:
+            layer.color_adjustment.update(**update["color"])
+        if "matting" in update:
+            self.set_layer_matting_mode(layer, update["matting"])
+        if "z" in update:
+            current_index = self.image_states.index(layer)
+            z = update["z"]
+            if z == "front":
+                new_index = len(self.image_states) - 1
+            elif z == "back":
+                new_index = 0
+            elif z == "up":
+                new_index = min(len(self.image_states) - 1, current_index + 1)
+            elif z == "down":
+                new_index = max(0, current_index - 1)
+            else:
+                new_index = z
+            if new_index != current_index:
+                self.image_states.remove(layer)
+                self.image_states.insert(new_index, layer)
+                needs_layers_refresh = True
+        return needs_layers_refresh
 
     def update_frame(self):
+        frame_start_time = time.perf_counter()
+        self.apply_pending_layer_control()
+        is_preview_rendered = self.render_outputs()
+        if is_preview_rendered and self.quality_governor.record_frame_time(time.perf_counter() - frame_start_time):
+            self.apply_quality_level()
+        if self.is_first_frame_pending and self.get_output_profile(OUTPUT_PROFILE_PREVIEW).delivered_frames:
+            self.is_first_frame_pending = False
+            STARTUP_TIMINGS["first_frame"] = time.perf_counter() - PROCESS_START_TIME
+            QTimer.singleShot(0, self.start_deferred_services)
+
+    def apply_quality_level(self):
+        quality_level = self.quality_governor.level
+        self.get_output_profile(OUTPUT_PROFILE_PREVIEW).frame_skip_interval = quality_level["preview_interval"]
+        for screen_capture_source in self.screen_capture_sources.values():
+            screen_capture_source.set_frame_interval(quality_level["screen_capture_interval"] / MASTER_FPS)
+
+    def render_outputs(self):
         current_preview_window_width = self.video_label.width()
         current_preview_window_height = self.video_label.height()
         if current_preview_window_width <= 0 or current_preview_window_height <= 0:
             blank_frame = np.zeros((max(1, INITIAL_PREVIEW_WINDOW_HEIGHT), max(1, INITIAL_PREVIEW_WINDOW_WIDTH), 3), dtype=np.uint8)
             self.update_image_signal.emit(blank_frame)
-            return
-        display_frame = np.zeros((current_preview_window_height, current_preview_window_width, 3), dtype=np.uint8)
-        for layer_state in self.image_states:
+            return False
+        self.frame_tick += 1
+        now = time.perf_counter()
+        due_outputs = [output for output in self.output_profiles if output.is_due(self.frame_tick, now)]
+        self.capture_layer_images()
+        self.update_roi_selection_preview()
+        if not due_outputs:
+            return False
+        quality_level = self.quality_governor.level
+        render_scale = max(output.fit_scale(current_preview_window_width, current_preview_window_height)
+                           for output in due_outputs) * quality_level["render_scale"]
+        master_frame = self.composite_layers(current_preview_window_width, current_preview_window_height,
+                                             render_scale, quality_level["interpolation"])
+        pyramid = FramePyramid(master_frame)
+        layer_frames = [(layer_state.id, layer_state.frame_sequence, layer_state.frame_timestamp)
+                        for layer_state in self.image_states
+                        if layer_state.is_visible and layer_state.original_image is not None]
+        test_pattern_layer = next((layer_state for layer_state in reversed(self.image_states)
+                                   if layer_state.source_type == SOURCE_TYPE_TEST_PATTERN and layer_state.is_visible), None)
+        for output in due_outputs:
+            target_width, target_height = output.target_size(current_preview_window_width, current_preview_window_height)
+            output_frame = pyramid.get(target_width, target_height)
+            self_test_probe = None
+            if test_pattern_layer is not None:
+                test_pattern_rect = map_canvas_rect_to_output(
+                    (test_pattern_layer.x, test_pattern_layer.y, test_pattern_layer.display_width, test_pattern_layer.display_height),
+                    current_preview_window_width, current_preview_window_height, target_width, target_height)
+                self_test_probe = lambda presented_frame, rect=test_pattern_rect: self.latency_self_test.sent_timestamp(presented_frame, rect)
+            output.deliver(output_frame, layer_frames, self_test_probe)
+        return any(output.name == OUTPUT_PROFILE_PREVIEW for output in due_outputs)
+
+    def capture_layer_images(self):
+        screen_capture_interval = self.quality_governor.level["screen_capture_interval"]
+        camera_frames = {}
+        polled_screen_regions = {}
+        for layer_index, layer_state in enumerate(self.image_states):
             if not layer_state.is_visible:
                 layer_state.original_image = None
                 continue
             if layer_state.source_type == SOURCE_TYPE_CAMERA:
-                if self.cap and self.cap.isOpened() and layer_state.id == self.active_camera_layer_id:
-                    ret, frame_camera = self.cap.read()
+                cap = self.camera_captures.get(layer_state.camera_index)
+                if cap is None or not cap.isOpened():
+                    layer_state.original_image = None
+                    continue
+                if self.isolated_capture_enabled:
+                    if layer_state.camera_index not in camera_frames:
+                        camera_frames[layer_state.camera_index] = cap.poll()
+                    if camera_frames[layer_state.camera_index] or layer_state.original_image is None:
+                        self.set_layer_frame(layer_state, cap.frame, cap.frame_timestamp)
+                        if layer_state.is_awaiting_camera_frame and cap.frame is not None and not cap.is_stale:
+                            self.fit_camera_layer_to_frame(layer_state, cap.frame)
+                    continue
+                if layer_state.camera_index not in camera_frames:
+                    ret, frame_camera = self.warm_camera_drainer.read(layer_state.camera_index, cap)
                     if ret:
-                        frame_camera = cv2.flip(frame_camera, 1)
-                        layer_state.original_image = frame_camera
+                        camera_frames[layer_state.camera_index] = (cv2.flip(frame_camera, 1), time.perf_counter())
                     else:
-                        layer_state.original_image = None
+                        camera_frames[layer_state.camera_index] = (None, None)
                         print(f"Błąd odczytu klatki z kamery {layer_state.camera_index}. Być może kamera jest używana przez inną aplikację lub odłączona.")
-                else:
-                    layer_state.original_image = None
+                self.set_layer_frame(layer_state, *camera_frames[layer_state.camera_index])
             elif layer_state.source_type == SOURCE_TYPE_SCREEN_REGION:
+                if self.isolated_capture_enabled and layer_state.screen_region:
+                    region_key = screen_region_key(layer_state.screen_region)
+                    screen_capture_source = self.get_screen_capture_source(layer_state.screen_region, layer_state.name)
+                    if region_key not in polled_screen_regions:
+                        polled_screen_regions[region_key] = screen_capture_source.poll()
+                    if polled_screen_regions[region_key] or layer_state.original_image is None:
+                        self.set_layer_frame(layer_state, screen_capture_source.frame, screen_capture_source.frame_timestamp)
+                    continue
+                if layer_state.original_image is not None and \
+                   (self.frame_tick + layer_index) % screen_capture_interval != 0:
+                    continue
                 if layer_state.screen_region:
+                    mss = lazy_import("mss")
                     try:
-                        sct_img = self.screen_capture_instance.grab(layer_state.screen_region)
-                        layer_state.original_image = np.array(sct_img)[:, :, :3]
+                        sct_img = self.get_screen_capture().grab(layer_state.screen_region)
+                        self.set_layer_frame(layer_state, np.array(sct_img)[:, :, :3], time.perf_counter())
                     except mss.exception.ScreenShotError:
                         layer_state.original_image = None
                     except Exception as e:
                         layer_state.original_image = None
+            elif layer_state.source_type == SOURCE_TYPE_REPLAY:
+                if layer_state.replay_playback is not None:
+                    self.set_layer_frame(layer_state, layer_state.replay_playback.current_frame(time.perf_counter()), None)
+                else:
+                    layer_state.original_image = None
+            elif layer_state.source_type == SOURCE_TYPE_TEST_PATTERN:
+                capture_timestamp = time.perf_counter()
+                self.set_layer_frame(layer_state, self.latency_self_test.next_frame(capture_timestamp), capture_timestamp)
+        idle_captures = {camera_index: cap for camera_index, cap in self.camera_captures.items()
+                         if camera_index not in camera_frames}
+        if self.isolated_capture_enabled:
+            for cap in idle_captures.values():
+                cap.poll()
+            for region_key, screen_capture_source in self.screen_capture_sources.items():
+                if region_key not in polled_screen_regions:
+                    screen_capture_source.poll()
+        else:
+            self.warm_camera_drainer.set_idle_captures(idle_captures)
+
+    def set_layer_frame(self, layer_state, image, capture_timestamp):
+        layer_state.original_image = image
+        if image is not None:
+            layer_state.frame_sequence += 1
+            layer_state.frame_timestamp = capture_timestamp
+
+    def composite_layers(self, canvas_width, canvas_height, render_scale=1.0, interpolation=cv2.INTER_AREA):
+        frame_width = max(1, int(round(canvas_width * render_scale)))
+        frame_height = max(1, int(round(canvas_height * render_scale)))
+        display_frame = np.zeros((frame_height, frame_width, 3), dtype=np.uint8)
         for layer_state in self.image_states:
             if not layer_state.is_visible or layer_state.original_image is None or \
                layer_state.display_width <= 0 or layer_state.display_height <= 0:
                 continue
-            target_width = max(1, layer_state.display_width)
-            target_height = max(1, layer_state.display_height)
             if layer_state.original_image.shape[0] == 0 or layer_state.original_image.shape[1] == 0:
                 continue
-            scaled_image = cv2.resize(layer_state.original_image,
-                                      (target_width, target_height),
-                                      interpolation=cv2.INTER_AREA)
-            x1, y1 = int(layer_state.x), int(layer_state.y)
-            x2, y2 = int(layer_state.x + layer_state.display_width), int(layer_state.y + layer_state.display_height)
+            x1 = int(round(layer_state.x * render_scale))
+            y1 = int(round(layer_state.y * render_scale))
+            x2 = int(round((layer_state.x + layer_state.display_width) * render_scale))
+            y2 = int(round((layer_state.y + layer_state.display_height) * render_scale))
+            target_width = max(1, x2 - x1)
+            target_height = max(1, y2 - y1)
             paste_x1 = max(0, x1)
             paste_y1 = max(0, y1)
-            paste_x2 = min(current_preview_window_width, x2)
-            paste_y2 = min(current_preview_window_height, y2)
+            paste_x2 = min(frame_width, x2)
+            paste_y2 = min(frame_height, y2)
+            if paste_x2 <= paste_x1 or paste_y2 <= paste_y1:
+                continue
+            scaled_image = cv2.resize(layer_state.original_image,
+                                      (target_width, target_height),
+                                      interpolation=interpolation)
             src_x1 = max(0, -x1)
             src_y1 = max(0, -y1)
             src_x2 = src_x1 + (paste_x2 - paste_x1)
             src_y2 = src_y1 + (paste_y2 - paste_y1)
-            if paste_x2 > paste_x1 and paste_y2 > paste_y1 and \
-               src_x2 > src_x1 and src_y2 > src_y1 and \
+            if src_x2 > src_x1 and src_y2 > src_y1 and \
                src_x2 <= scaled_image.shape[1] and src_y2 <= scaled_image.shape[0]:
-                display_frame[paste_y1:paste_y2, paste_x1:paste_x2] = scaled_image[src_y1:src_y2, src_x1:src_x2]
-        self.update_image_signal.emit(display_frame)
+                layer_image = layer_state.color_adjustment.apply(scaled_image[src_y1:src_y2, src_x1:src_x2])
+                if layer_state.source_type == SOURCE_TYPE_CAMERA and layer_state.matting_mode != MATTING_MODE_OFF:
+                    if layer_state.matting is None:
+                        layer_state.matting = CameraMatting(self.matting_executor)
+                    layer_state.matting.update(layer_state.original_image, time.perf_counter())
+                    layer_image = layer_state.matting.composite(layer_image,
+                                                                display_frame[paste_y1:paste_y2, paste_x1:paste_x2],
+                                                                layer_state.matting_mode, (target_width, target_height),
+                                                                (src_x1, src_y1))
+                display_frame[paste_y1:paste_y2, paste_x1:paste_x2] = layer_image
+        return display_frame
 
     def update_video_label(self, cv_img):
         if cv_img is None:
@@ -747,6 +2663,9 @@ class CameraScreenOverlayApp(QMainWindow):
         self.video_label.setPixmap(pixmap.scaled(self.video_label.size(),
                                                  Qt.KeepAspectRatio,
                                                  Qt.SmoothTransformation))
+        on_presented, self.preview_presented_callback = self.preview_presented_callback, None
+        if on_presented is not None:
+            on_presented(time.perf_counter(), lambda: qimage_to_array(q_img))
 
     def get_resize_handle_type(self, img_state, mouse_x, mouse_y):
         x, y, w, h = img_state.x, img_state.y, img_state.display_width, img_state.display_height
@@ -934,9 +2853,20 @@ class CameraScreenOverlayApp(QMainWindow):
             event.ignore()
 
     def closeEvent(self, event):
-        if self.cap and self.cap.isOpened():
-            self.cap.release()
         self.timer.stop()
+        self.save_last_layout()
+        if HAS_KEYBOARD:
+            self.registered_scene_hotkeys = []
+            keyboard.unhook_all_hotkeys()
+        self.release_all_capture_sources()
+        self.warm_camera_drainer.stop()
+        self._close_roi_selection_dialog()
+        if self.network_stream_output is not None:
+            self.network_stream_output.stop()
+        if self.layer_control_server is not None:
+            self.layer_control_server.stop()
+        self.replay_buffer.shutdown()
+        self.matting_executor.shutdown(wait=False, cancel_futures=True)
         print("Aplikacja zamknięta.")
         super().closeEvent(event)
 
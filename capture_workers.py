@@ -0,0 +1,282 @@
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+CAPTURE_SOURCE_CAMERA = "camera"
+CAPTURE_SOURCE_SCREEN_REGION = "screen_region"
+CAPTURE_WORKER_SLOT_COUNT = 3
+CAPTURE_WORKER_HEADER_BYTES = 64
+CAPTURE_WORKER_MAX_FRAME_BYTES = 1920 * 1080 * 3
+CAPTURE_WORKER_START_TIMEOUT = 10.0
+CAPTURE_WORKER_FRAME_TIMEOUT = 2.0
+CAPTURE_WORKER_STALE_AFTER = 0.5
+CAPTURE_WORKER_STOP_TIMEOUT = 0.5
+CAPTURE_WORKER_BACKOFF_INITIAL = 0.5
+CAPTURE_WORKER_BACKOFF_MAX = 10.0
+CAPTURE_WORKER_STABLE_AFTER = 5.0
+CAPTURE_WORKER_STALE_BADGE = "BRAK SYGNALU"
+
+def open_worker_source(source_kind, source_args):
+    if source_kind == CAPTURE_SOURCE_CAMERA:
+        camera_index, width, height = source_args
+        cap = cv2.VideoCapture(camera_index, cv2.CAP_DSHOW)
+        if not cap.isOpened():
+            raise RuntimeError(f"Nie można otworzyć kamery o indeksie {camera_index}.")
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        return cap, lambda: read_camera_frame(cap, camera_index)
+    import mss
+    screen_capture = mss.mss()
+    return screen_capture, lambda: np.array(screen_capture.grab(source_args))[:, :, :3]
+
+def close_worker_source(source_kind, source):
+    if source_kind == CAPTURE_SOURCE_CAMERA:
+        source.release()
+    else:
+        source.close()
+
+def read_camera_frame(cap, camera_index):
+    ret, frame = cap.read()
+    if not ret:
+        raise RuntimeError(f"Błąd odczytu klatki z kamery {camera_index}.")
+    return cv2.flip(frame, 1)
+
+def fit_frame_to_slot(frame, slot_bytes):
+    if frame.nbytes <= slot_bytes:
+        return frame
+    scale = (slot_bytes / frame.nbytes) ** 0.5
+    target_width = max(1, int(frame.shape[1] * scale))
+    target_height = max(1, int(frame.shape[0] * scale))
+    return cv2.resize(frame, (target_width, target_height), interpolation=cv2.INTER_AREA)
+
+def run_capture_worker(source_kind, source_args, shm_name, slot_bytes, frame_interval, stop_event, conn):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slot_sequences = np.ndarray((CAPTURE_WORKER_SLOT_COUNT,), dtype=np.int64, buffer=shm.buf)
+    source = None
+    try:
+        source, read_frame = open_worker_source(source_kind, source_args)
+        sequence = 0
+        next_frame_time = time.perf_counter()
+        while not stop_event.is_set():
+            if source_kind == CAPTURE_SOURCE_SCREEN_REGION:
+                delay = next_frame_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                next_frame_time = max(next_frame_time + frame_interval.value, time.perf_counter())
+            frame = np.ascontiguousarray(fit_frame_to_slot(read_frame(), slot_bytes))
+            capture_timestamp = time.perf_counter()
+            sequence += 1
+            slot = sequence % CAPTURE_WORKER_SLOT_COUNT
+            offset = CAPTURE_WORKER_HEADER_BYTES + slot * slot_bytes
+            slot_sequences[slot] = -1
+            shm.buf[offset:offset + frame.nbytes] = frame.reshape(-1).data
+            slot_sequences[slot] = sequence
+            conn.send(("frame", slot, frame.shape, sequence, capture_timestamp))
+    except Exception as e:
+        conn.send(("error", str(e)))
+    finally:
+        if source is not None:
+            close_worker_source(source_kind, source)
+        del slot_sequences
+        shm.close()
+        conn.close()
+
+def finish_worker_process(process, conn):
+    process.join(CAPTURE_WORKER_STOP_TIMEOUT)
+    if process.is_alive():
+        process.kill()
+        process.join(CAPTURE_WORKER_STOP_TIMEOUT)
+    conn.close()
+
+def draw_stale_badge(frame):
+    badged_frame = frame.copy()
+    text_scale = max(0.5, min(badged_frame.shape[1], badged_frame.shape[0]) / 480.0)
+    (text_width, text_height), baseline = cv2.getTextSize(CAPTURE_WORKER_STALE_BADGE, cv2.FONT_HERSHEY_SIMPLEX, text_scale, 2)
+    padding = int(8 * text_scale)
+    cv2.rectangle(badged_frame, (0, 0), (text_width + 2 * padding, text_height + baseline + 2 * padding), (0, 0, 200), -1)
+    cv2.putText(badged_frame, CAPTURE_WORKER_STALE_BADGE, (padding, padding + text_height),
+                cv2.FONT_HERSHEY_SIMPLEX, text_scale, (255, 255, 255), 2, cv2.LINE_AA)
+    return badged_frame
+
+class ThreadedCaptureSource:
+    def __init__(self, source_kind, source_args, name, frame_interval=0.0):
+        self.source_kind = source_kind
+        self.source_args = source_args
+        self.name = name
+        self.frame_interval = frame_interval
+        self.lock = threading.Lock()
+        self.latest_frame = None
+        self.latest_timestamp = None
+        self.frame = None
+        self.frame_timestamp = None
+        self.is_stale = False
+        self.stop_event = threading.Event()
+        threading.Thread(target=self.run, name=f"capture-{name}", daemon=True).start()
+
+    def run(self):
+        source = None
+        last_error = None
+        try:
+            source, read_frame = open_worker_source(self.source_kind, self.source_args)
+            while not self.stop_event.is_set():
+                frame_start_time = time.perf_counter()
+                try:
+                    frame = read_frame()
+                except Exception as e:
+                    if str(e) != last_error:
+                        print(f"Błąd przechwytywania '{self.name}': {e}")
+                        last_error = str(e)
+                else:
+                    with self.lock:
+                        self.latest_frame = frame
+                        self.latest_timestamp = time.perf_counter()
+                self.stop_event.wait(max(0.0, self.frame_interval - (time.perf_counter() - frame_start_time)))
+        except Exception as e:
+            print(f"Błąd przechwytywania '{self.name}': {e}")
+        finally:
+            if source is not None:
+                close_worker_source(self.source_kind, source)
+
+    def poll(self):
+        with self.lock:
+            frame, timestamp = self.latest_frame, self.latest_timestamp
+        if timestamp is None or timestamp == self.frame_timestamp:
+            return False
+        self.frame = frame
+        self.frame_timestamp = timestamp
+        return True
+
+    def release(self):
+        self.stop_event.set()
+
+class IsolatedCaptureSource:
+    def __init__(self, source_kind, source_args, name, frame_interval=0.0, slot_bytes=CAPTURE_WORKER_MAX_FRAME_BYTES):
+        self.source_kind = source_kind
+        self.source_args = source_args
+        self.name = name
+        self.slot_bytes = slot_bytes
+        self.context = multiprocessing.get_context("spawn")
+        self.frame_interval = self.context.Value("d", frame_interval, lock=False)
+        self.shm = shared_memory.SharedMemory(create=True,
+                                              size=CAPTURE_WORKER_HEADER_BYTES + CAPTURE_WORKER_SLOT_COUNT * slot_bytes)
+        self.slot_sequences = np.ndarray((CAPTURE_WORKER_SLOT_COUNT,), dtype=np.int64, buffer=self.shm.buf)
+        self.process = None
+        self.conn = None
+        self.stop_event = None
+        self.started_at = 0.0
+        self.last_frame_time = None
+        self.next_restart_time = 0.0
+        self.restart_backoff = CAPTURE_WORKER_BACKOFF_INITIAL
+        self.restart_count = 0
+        self.last_good_frame = None
+        self.frame = None
+        self.frame_timestamp = None
+        self.is_stale = False
+        self.is_released = False
+        self.start()
+
+    def start(self):
+        parent_conn, child_conn = self.context.Pipe(duplex=False)
+        self.stop_event = self.context.Event()
+        self.slot_sequences[:] = 0
+        self.process = self.context.Process(target=run_capture_worker,
+                                            args=(self.source_kind, self.source_args, self.shm.name, self.slot_bytes,
+                                                  self.frame_interval, self.stop_event, child_conn),
+                                            name=f"capture-{self.name}", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.started_at = time.perf_counter()
+        self.last_frame_time = None
+
+    def stop_process(self, force=False):
+        if self.process is None:
+            return
+        process, conn = self.process, self.conn
+        self.process = None
+        self.conn = None
+        self.stop_event.set()
+        if force:
+            process.kill()
+        threading.Thread(target=finish_worker_process, args=(process, conn),
+                         name=f"capture-stop-{self.name}", daemon=True).start()
+
+    def schedule_restart(self, reason):
+        self.stop_process(force=True)
+        now = time.perf_counter()
+        self.next_restart_time = now + self.restart_backoff
+        print(f"Ostrzeżenie: Proces przechwytywania '{self.name}' {reason}. "
+              f"Ponowne uruchomienie za {self.restart_backoff:.1f} s.")
+        self.restart_backoff = min(CAPTURE_WORKER_BACKOFF_MAX, self.restart_backoff * 2)
+
+    def set_frame_interval(self, frame_interval):
+        self.frame_interval.value = frame_interval
+
+    def isOpened(self):
+        return not self.is_released
+
+    def read_frame_message(self, message):
+        _, slot, shape, sequence, capture_timestamp = message
+        offset = CAPTURE_WORKER_HEADER_BYTES + slot * self.slot_bytes
+        if self.slot_sequences[slot] != sequence:
+            return False
+        frame = np.frombuffer(self.shm.buf, dtype=np.uint8, count=int(np.prod(shape)), offset=offset).reshape(shape).copy()
+        if self.slot_sequences[slot] != sequence:
+            return False
+        self.last_good_frame = frame
+        self.frame = frame
+        self.frame_timestamp = capture_timestamp
+        return True
+
+    def poll(self):
+        if self.is_released:
+            return False
+        now = time.perf_counter()
+        has_new_frame = False
+        if self.process is None:
+            if now >= self.next_restart_time:
+                self.restart_count += 1
+                self.start()
+        else:
+            last_frame_message = None
+            try:
+                while self.conn.poll():
+                    message = self.conn.recv()
+                    if message[0] == "frame":
+                        last_frame_message = message
+                    elif message[0] == "error":
+                        print(f"Błąd procesu przechwytywania '{self.name}': {message[1]}")
+            except (EOFError, OSError):
+                pass
+            if last_frame_message is not None and self.read_frame_message(last_frame_message):
+                has_new_frame = True
+                self.last_frame_time = now
+                if now - self.started_at >= CAPTURE_WORKER_STABLE_AFTER:
+                    self.restart_backoff = CAPTURE_WORKER_BACKOFF_INITIAL
+            if not self.process.is_alive():
+                self.schedule_restart(f"zakończył działanie (kod {self.process.exitcode})")
+            elif self.last_frame_time is None and now - self.started_at > CAPTURE_WORKER_START_TIMEOUT:
+                self.schedule_restart("nie dostarczył pierwszej klatki")
+            elif self.last_frame_time is not None and now - self.last_frame_time > CAPTURE_WORKER_FRAME_TIMEOUT:
+                self.schedule_restart("przestał odpowiadać")
+        is_stale = self.last_frame_time is None or now - self.last_frame_time > CAPTURE_WORKER_STALE_AFTER
+        if has_new_frame:
+            self.is_stale = False
+        elif is_stale and not self.is_stale and self.last_good_frame is not None:
+            self.is_stale = True
+            self.frame = draw_stale_badge(self.last_good_frame)
+            return True
+        return has_new_frame
+
+    def release(self):
+        if self.is_released:
+            return
+        self.is_released = True
+        self.stop_process()
+        del self.slot_sequences
+        self.shm.close()
+        self.shm.unlink()
@@ -0,0 +1,406 @@
+import json
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+STREAM_MJPEG_BOUNDARY = "frame"
+STREAM_RAW_HEADER = struct.Struct("!IIHHB")
+CONTROL_API_MAX_BODY_SIZE = 1024 * 1024
+CONTROL_API_ALLOWED_HOSTS = ("127.0.0.1", "localhost")
+CONTROL_API_CONTENT_TYPE = "application/json"
+CONTROL_TRANSACTION_LIST = "list"
+CONTROL_TRANSACTION_BATCH = "batch"
+CONTROL_TRANSACTION_LATENCY = "latency"
+
+class FrameDelivery:
+    def __init__(self, on_sent):
+        self.on_sent = on_sent
+        self.lock = threading.Lock()
+
+    def sent(self, read_sent_frame):
+        with self.lock:
+            on_sent, self.on_sent = self.on_sent, None
+        if on_sent is not None:
+            on_sent(time.perf_counter(), read_sent_frame)
+
+def decode_jpeg_packet(data):
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+def decode_raw_packet(header, payload):
+    _, _, width, height, channels = STREAM_RAW_HEADER.unpack(header)
+    return np.frombuffer(payload, dtype=np.uint8).reshape(height, width, channels)
+
+class StreamClient:
+    def __init__(self, address, queue_size):
+        self.address = address
+        self.packets = deque(maxlen=max(1, queue_size))
+        self.condition = threading.Condition()
+        self.is_closed = False
+        self.sent_packets = 0
+        self.dropped_packets = 0
+
+    def push(self, packet):
+        with self.condition:
+            if self.is_closed:
+                return
+            if len(self.packets) == self.packets.maxlen:
+                self.dropped_packets += 1
+            self.packets.append(packet)
+            self.condition.notify()
+
+    def pop(self, timeout=1.0):
+        with self.condition:
+            if not self.packets and not self.is_closed:
+                self.condition.wait(timeout)
+            if self.is_closed or not self.packets:
+                return None
+            return self.packets.popleft()
+
+    def close(self):
+        with self.condition:
+            self.is_closed = True
+            self.packets.clear()
+            self.condition.notify_all()
+
+class MjpegStreamHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        stream_output = self.server.stream_output
+        if self.path in ("/", "/stream.mjpg"):
+            self._serve_stream(stream_output)
+        else:
+            self.send_error(404)
+
+    def _serve_stream(self, stream_output):
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={STREAM_MJPEG_BOUNDARY}")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        client = StreamClient(self.client_address, stream_output.client_queue_size)
+        stream_output.add_client(client, is_raw=False)
+        try:
+            while not client.is_closed:
+                packet = client.pop()
+                if packet is None:
+                    continue
+                data, delivery = packet
+                self.wfile.write(f"--{STREAM_MJPEG_BOUNDARY}\r\n".encode("ascii"))
+                self.wfile.write(b"Content-Type: image/jpeg\r\n")
+                self.wfile.write(f"Content-Length: {len(data)}\r\n\r\n".encode("ascii"))
+                self.wfile.write(data)
+                self.wfile.write(b"\r\n")
+                self.wfile.flush()
+                delivery.sent(lambda: decode_jpeg_packet(data))
+                client.sent_packets += 1
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+            pass
+        finally:
+            stream_output.remove_client(client, is_raw=False)
+
+    def log_message(self, format, *args):
+        pass
+
+class RawFrameStreamHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        stream_output = self.server.stream_output
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = StreamClient(self.client_address, stream_output.client_queue_size)
+        stream_output.add_client(client, is_raw=True)
+        try:
+            while not client.is_closed:
+                packet = client.pop()
+                if packet is None:
+                    continue
+                header, payload, delivery = packet
+                self.request.sendall(header)
+                self.request.sendall(payload)
+                delivery.sent(lambda: decode_raw_packet(header, payload))
+                client.sent_packets += 1
+        except OSError:
+            pass
+        finally:
+            stream_output.remove_client(client, is_raw=True)
+
+class RawFrameTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class NetworkStreamOutput:
+    def __init__(self, bind_address, http_port, tcp_port, client_queue_size, encoder_pool_factory):
+        self.bind_address = bind_address
+        self.http_port = http_port
+        self.tcp_port = tcp_port
+        self.client_queue_size = client_queue_size
+        self.encoder_pool_factory = encoder_pool_factory
+        self.encoder_pool = None
+        self.http_server = None
+        self.tcp_server = None
+        self.mjpeg_clients = set()
+        self.raw_clients = set()
+        self.clients_lock = threading.Lock()
+        self.frame_sequence = 0
+        self.last_jpeg_sequence = 0
+        self.is_running = False
+
+    @property
+    def http_address(self):
+        return self.http_server.server_address if self.http_server else None
+
+    @property
+    def tcp_address(self):
+        return self.tcp_server.server_address if self.tcp_server else None
+
+    def start(self):
+        if self.is_running:
+            return
+        try:
+            self.http_server = ThreadingHTTPServer((self.bind_address, self.http_port), MjpegStreamHandler)
+            self.http_server.daemon_threads = True
+            self.http_server.stream_output = self
+            self.tcp_server = RawFrameTCPServer((self.bind_address, self.tcp_port), RawFrameStreamHandler)
+            self.tcp_server.stream_output = self
+        except OSError:
+            self._close_servers()
+            raise
+        self.encoder_pool = self.encoder_pool_factory()
+        self.frame_sequence = 0
+        self.last_jpeg_sequence = 0
+        self.is_running = True
+        threading.Thread(target=self.http_server.serve_forever, name="mjpeg-server", daemon=True).start()
+        threading.Thread(target=self.tcp_server.serve_forever, name="raw-frame-server", daemon=True).start()
+        print(f"Strumień MJPEG: http://{self.http_address[0]}:{self.http_address[1]}/stream.mjpg")
+        print(f"Strumień surowych klatek TCP: {self.tcp_address[0]}:{self.tcp_address[1]}")
+
+    def stop(self):
+        if not self.is_running:
+            return
+        self.is_running = False
+        for server in (self.http_server, self.tcp_server):
+            if server:
+                server.shutdown()
+        with self.clients_lock:
+            clients = list(self.mjpeg_clients) + list(self.raw_clients)
+            self.mjpeg_clients.clear()
+            self.raw_clients.clear()
+        for client in clients:
+            client.close()
+        self._close_servers()
+        if self.encoder_pool:
+            self.encoder_pool.shutdown()
+            self.encoder_pool = None
+        print("Strumień sieciowy zatrzymany.")
+
+    def _close_servers(self):
+        for server in (self.http_server, self.tcp_server):
+            if server:
+                server.server_close()
+        self.http_server = None
+        self.tcp_server = None
+
+    def add_client(self, client, is_raw):
+        with self.clients_lock:
+            if not self.is_running:
+                client.close()
+                return
+            (self.raw_clients if is_raw else self.mjpeg_clients).add(client)
+        print(f"Klient strumienia {'TCP' if is_raw else 'MJPEG'} połączony: {client.address[0]}:{client.address[1]}")
+
+    def remove_client(self, client, is_raw):
+        with self.clients_lock:
+            (self.raw_clients if is_raw else self.mjpeg_clients).discard(client)
+        client.close()
+        print(f"Klient strumienia {'TCP' if is_raw else 'MJPEG'} rozłączony: {client.address[0]}:{client.address[1]} "
+              f"(wysłane: {client.sent_packets}, pominięte: {client.dropped_packets})")
+
+    def has_clients(self):
+        with self.clients_lock:
+            return self.is_running and bool(self.mjpeg_clients or self.raw_clients)
+
+    def push_frame(self, frame, on_sent=None):
+        if not self.is_running or frame is None:
+            return
+        with self.clients_lock:
+            has_mjpeg_clients = bool(self.mjpeg_clients)
+            raw_clients = list(self.raw_clients)
+        if not has_mjpeg_clients and not raw_clients:
+            return
+        self.frame_sequence += 1
+        sequence = self.frame_sequence
+        delivery = FrameDelivery(on_sent)
+        if has_mjpeg_clients:
+            self.encoder_pool.submit(frame, lambda data: self._broadcast_jpeg(sequence, data, delivery))
+        if raw_clients:
+            frame = np.ascontiguousarray(frame)
+            height, width = frame.shape[:2]
+            channels = frame.shape[2] if frame.ndim == 3 else 1
+            payload = frame.tobytes()
+            header = STREAM_RAW_HEADER.pack(len(payload), sequence, width, height, channels)
+            for client in raw_clients:
+                client.push((header, payload, delivery))
+
+    def _broadcast_jpeg(self, sequence, data, delivery):
+        with self.clients_lock:
+            if sequence <= self.last_jpeg_sequence:
+                return
+            self.last_jpeg_sequence = sequence
+            clients = list(self.mjpeg_clients)
+        for client in clients:
+            client.push((data, delivery))
+
+def reject_json_constant(name):
+    raise ValueError(f"Niedozwolona wartość '{name}'")
+
+class LayerControlTransaction:
+    def __init__(self, kind, updates=None):
+        self.kind = kind
+        self.updates = updates or []
+        self.lock = threading.Lock()
+        self.done_event = threading.Event()
+        self.is_started = False
+        self.is_cancelled = False
+        self.result = None
+        self.error = None
+
+    def begin(self):
+        with self.lock:
+            if self.is_cancelled:
+                return False
+            self.is_started = True
+            return True
+
+    def cancel(self):
+        with self.lock:
+            if self.is_started:
+                return False
+            self.is_cancelled = True
+            return True
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.done_event.set()
+
+    def wait(self, timeout):
+        if self.done_event.wait(timeout):
+            return True
+        if self.cancel():
+            return False
+        return self.done_event.wait(timeout)
+
+class LayerControlHandler(BaseHTTPRequestHandler):
+    def _is_allowed_host(self):
+        port = self.server.server_address[1]
+        allowed_hosts = {f"{host}:{port}" for host in CONTROL_API_ALLOWED_HOSTS}
+        if self.headers.get("Host", "").lower() in allowed_hosts:
+            return True
+        self._send_json(403, {"error": "Niedozwolony nagłówek Host."})
+        return False
+
+    def do_GET(self):
+        if not self._is_allowed_host():
+            return
+        if self.path == "/layers":
+            self._run_transaction(LayerControlTransaction(CONTROL_TRANSACTION_LIST))
+        elif self.path == "/latency":
+            self._run_transaction(LayerControlTransaction(CONTROL_TRANSACTION_LATENCY))
+        else:
+            self._send_json(404, {"error": "Nieznany adres."})
+
+    def do_POST(self):
+        if not self._is_allowed_host():
+            return
+        if self.path != "/layers/batch":
+            self._send_json(404, {"error": "Nieznany adres."})
+            return
+        if self.headers.get_content_type() != CONTROL_API_CONTENT_TYPE:
+            self._send_json(415, {"error": f"Oczekiwano treści typu {CONTROL_API_CONTENT_TYPE}."})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length <= 0 or length > CONTROL_API_MAX_BODY_SIZE:
+            self._send_json(400, {"error": "Nieprawidłowa długość treści żądania."})
+            return
+        try:
+            payload = json.loads(self.rfile.read(length).decode("utf-8"), parse_constant=reject_json_constant)
+        except (UnicodeDecodeError, ValueError) as e:
+            self._send_json(400, {"error": f"Nieprawidłowy JSON: {e}"})
+            return
+        updates = payload.get("updates") if isinstance(payload, dict) else None
+        if not isinstance(updates, list):
+            self._send_json(400, {"error": "Oczekiwano obiektu z listą 'updates'."})
+            return
+        self._run_transaction(LayerControlTransaction(CONTROL_TRANSACTION_BATCH, updates))
+
+    def _run_transaction(self, transaction):
+        control_server = self.server.control_server
+        control_server.submit(transaction)
+        if not transaction.wait(control_server.timeout):
+            self._send_json(503, {"error": "Aplikacja nie przetworzyła żądania na czas."})
+            return
+        if transaction.error is not None:
+            self._send_json(400, {"error": transaction.error})
+            return
+        self._send_json(200, transaction.result)
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+class LayerControlServer:
+    def __init__(self, bind_address, port, timeout):
+        self.bind_address = bind_address
+        self.port = port
+        self.timeout = timeout
+        self.http_server = None
+        self.pending_transactions = deque()
+        self.is_running = False
+
+    @property
+    def address(self):
+        return self.http_server.server_address if self.http_server else None
+
+    def start(self):
+        if self.is_running:
+            return
+        self.http_server = ThreadingHTTPServer((self.bind_address, self.port), LayerControlHandler)
+        self.http_server.daemon_threads = True
+        self.http_server.control_server = self
+        self.is_running = True
+        threading.Thread(target=self.http_server.serve_forever, name="layer-control-server", daemon=True).start()
+        print(f"API sterowania warstwami: http://{self.address[0]}:{self.address[1]}/layers")
+
+    def stop(self):
+        if not self.is_running:
+            return
+        self.is_running = False
+        self.http_server.shutdown()
+        self.http_server.server_close()
+        self.http_server = None
+        for transaction in self.take_pending_transactions():
+            if transaction.begin():
+                transaction.finish(error="Aplikacja jest zamykana.")
+
+    def submit(self, transaction):
+        self.pending_transactions.append(transaction)
+
+    def take_pending_transactions(self):
+        transactions = []
+        while self.pending_transactions:
+            transactions.append(self.pending_transactions.popleft())
+        return transactions
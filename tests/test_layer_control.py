@@ -0,0 +1,53 @@
+import unittest
+
+from Camera_Cap import (SOURCE_TYPE_SCREEN_REGION, CameraScreenOverlayApp, ImageState, LayerControlError,
+                        MAX_LAYER_COORDINATE)
+
+class LayerControlHost:
+    get_layer_by_id = CameraScreenOverlayApp.get_layer_by_id
+    validate_layer_update = CameraScreenOverlayApp.validate_layer_update
+    apply_layer_update = CameraScreenOverlayApp.apply_layer_update
+    apply_layer_updates = CameraScreenOverlayApp.apply_layer_updates
+
+    def __init__(self, image_states):
+        self.image_states = image_states
+
+class LayerControlBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.first_layer = ImageState("Pierwsza", SOURCE_TYPE_SCREEN_REGION, 200, 100, 10, 20, layer_id="first")
+        self.second_layer = ImageState("Druga", SOURCE_TYPE_SCREEN_REGION, 300, 150, 30, 40, layer_id="second")
+        self.host = LayerControlHost([self.first_layer, self.second_layer])
+
+    def layer_snapshot(self):
+        return [layer_state.to_dict(i) for i, layer_state in enumerate(self.host.image_states)]
+
+    def test_batch_applies_all_updates(self):
+        self.host.apply_layer_updates([
+            {"id": "first", "x": 50, "visible": False},
+            {"id": "second", "y": -5, "name": "Nowa", "z": "back"},
+        ])
+        self.assertEqual((self.first_layer.x, self.first_layer.is_visible), (50, False))
+        self.assertEqual((self.second_layer.y, self.second_layer.name), (-5, "Nowa"))
+        self.assertEqual(self.host.image_states, [self.second_layer, self.first_layer])
+
+    def test_batch_with_one_invalid_update_changes_nothing(self):
+        before = self.layer_snapshot()
+        for invalid_update in ({"id": "missing", "x": 1}, {"id": "second", "color": {"unknown": 1}},
+                               {"id": "second", "visible": "tak"}, {"id": "second", "z": 5}):
+            with self.assertRaises(LayerControlError):
+                self.host.apply_layer_updates([{"id": "first", "x": 500, "name": "Zmieniona"}, invalid_update])
+        self.assertEqual(self.layer_snapshot(), before)
+
+    def test_non_finite_and_oversized_numbers_are_rejected(self):
+        for value in (float("nan"), float("inf"), float("-inf"), 10 ** 400, -10 ** 400,
+                      MAX_LAYER_COORDINATE + 1, True, "10"):
+            for key in ("x", "y", "width", "height"):
+                with self.subTest(key=key, value=value), self.assertRaises(LayerControlError):
+                    self.host.validate_layer_update({"id": "first", key: value})
+
+    def test_coordinate_limits_are_accepted(self):
+        self.host.apply_layer_updates([{"id": "first", "x": -MAX_LAYER_COORDINATE, "y": MAX_LAYER_COORDINATE}])
+        self.assertEqual((self.first_layer.x, self.first_layer.y), (-MAX_LAYER_COORDINATE, MAX_LAYER_COORDINATE))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import socket
+import time
+import unittest
+
+import cv2
+import numpy as np
+
+from Camera_Cap import FrameEncoderPool
+from network_servers import STREAM_MJPEG_BOUNDARY, STREAM_RAW_HEADER, NetworkStreamOutput
+
+CLIENT_TIMEOUT = 5.0
+
+class NetworkStreamOutputTest(unittest.TestCase):
+    def setUp(self):
+        self.stream_output = NetworkStreamOutput("127.0.0.1", 0, 0, 2, lambda: FrameEncoderPool(1, 80))
+        self.stream_output.start()
+        self.addCleanup(self.stream_output.stop)
+        self.frame = np.zeros((48, 64, 3), dtype=np.uint8)
+        self.frame[:, :, 0] = np.arange(64, dtype=np.uint8) * 4
+        self.frame[:, :, 1] = np.arange(48, dtype=np.uint8)[:, None] * 5
+        self.sent_frames = []
+
+    def connect(self, address):
+        client_socket = socket.create_connection(address, timeout=CLIENT_TIMEOUT)
+        self.addCleanup(client_socket.close)
+        client_stream = client_socket.makefile("rb")
+        self.addCleanup(client_stream.close)
+        return client_socket, client_stream
+
+    def wait_until(self, predicate, message):
+        deadline = time.perf_counter() + CLIENT_TIMEOUT
+        while time.perf_counter() < deadline:
+            if predicate():
+                return
+            time.sleep(0.01)
+        self.fail(message)
+
+    def record_sent_frame(self, sent_at, read_sent_frame):
+        self.sent_frames.append(read_sent_frame())
+
+    def wait_for_client(self, clients):
+        self.wait_until(lambda: bool(clients), "Klient nie został zarejestrowany.")
+
+    def test_mjpeg_client_receives_jpeg_part(self):
+        client_socket, client_stream = self.connect(self.stream_output.http_address)
+        client_socket.sendall(b"GET /stream.mjpg HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n")
+        self.assertIn(b" 200 ", client_stream.readline())
+        headers = []
+        while True:
+            line = client_stream.readline()
+            if line == b"\r\n":
+                break
+            headers.append(line.decode("ascii").strip().lower())
+        self.assertIn(f"content-type: multipart/x-mixed-replace; boundary={STREAM_MJPEG_BOUNDARY}", headers)
+        self.wait_for_client(self.stream_output.mjpeg_clients)
+        self.stream_output.push_frame(self.frame, self.record_sent_frame)
+        self.assertEqual(client_stream.readline(), f"--{STREAM_MJPEG_BOUNDARY}\r\n".encode("ascii"))
+        self.assertEqual(client_stream.readline(), b"Content-Type: image/jpeg\r\n")
+        content_length = client_stream.readline()
+        self.assertTrue(content_length.startswith(b"Content-Length: "))
+        self.assertEqual(client_stream.readline(), b"\r\n")
+        data = client_stream.read(int(content_length.split(b":")[1]))
+        self.assertEqual(client_stream.readline(), b"\r\n")
+        self.assertEqual(data[:2], b"\xff\xd8")
+        decoded_frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(decoded_frame.shape, self.frame.shape)
+        self.wait_until(lambda: self.sent_frames, "Nie zgłoszono wysłania klatki.")
+        self.assertEqual(len(self.sent_frames), 1)
+        self.assertEqual(self.sent_frames[0].shape, self.frame.shape)
+
+    def test_raw_client_receives_header_and_payload(self):
+        _, client_stream = self.connect(self.stream_output.tcp_address)
+        self.wait_for_client(self.stream_output.raw_clients)
+        self.stream_output.push_frame(self.frame, self.record_sent_frame)
+        payload_size, sequence, width, height, channels = STREAM_RAW_HEADER.unpack(client_stream.read(STREAM_RAW_HEADER.size))
+        self.assertEqual((payload_size, sequence, width, height, channels), (self.frame.nbytes, 1, 64, 48, 3))
+        self.assertEqual(client_stream.read(payload_size), self.frame.tobytes())
+        self.wait_until(lambda: self.sent_frames, "Nie zgłoszono wysłania klatki.")
+        self.assertEqual(len(self.sent_frames), 1)
+        self.assertTrue(np.array_equal(self.sent_frames[0], self.frame))
+
+if __name__ == "__main__":
+    unittest.main()
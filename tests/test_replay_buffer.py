@@ -0,0 +1,51 @@
+import unittest
+
+from Camera_Cap import ReplayBuffer
+
+FRAME_BYTES = 400
+
+class ReplayBufferTest(unittest.TestCase):
+    def create_buffer(self, seconds=10.0, max_bytes=1024 * 1024, fps=30):
+        replay_buffer = ReplayBuffer(seconds, max_bytes / (1024 * 1024), fps, encoder_workers=1)
+        self.addCleanup(replay_buffer.shutdown)
+        return replay_buffer
+
+    def stored_timestamps(self, replay_buffer):
+        return [timestamp for timestamp, _ in replay_buffer.encoded_frames_between(0.0, float("inf"))]
+
+    def test_byte_cap_evicts_oldest_frames(self):
+        replay_buffer = self.create_buffer(max_bytes=1024)
+        for timestamp in (1.0, 1.1, 1.2, 1.3):
+            replay_buffer._append(timestamp, bytes([int(timestamp * 10)]) * FRAME_BYTES)
+        self.assertEqual(self.stored_timestamps(replay_buffer), [1.2, 1.3])
+        self.assertEqual(replay_buffer.total_bytes, 2 * FRAME_BYTES)
+        self.assertEqual(replay_buffer.encoded_frame_at(1.25), (1.2, bytes([12]) * FRAME_BYTES))
+
+    def test_frames_older_than_window_are_evicted(self):
+        replay_buffer = self.create_buffer(seconds=1.0)
+        for timestamp in (0.0, 0.5, 1.0, 1.6):
+            replay_buffer._append(timestamp, b"x" * FRAME_BYTES)
+        self.assertEqual(self.stored_timestamps(replay_buffer), [1.0, 1.6])
+        self.assertEqual(replay_buffer.time_range(), (1.0, 1.6))
+
+    def test_slot_capacity_wraps_around(self):
+        replay_buffer = self.create_buffer(seconds=1.0, fps=4)
+        timestamps = [index * 0.01 for index in range(1, 13)]
+        for timestamp in timestamps:
+            replay_buffer._append(timestamp, b"x" * FRAME_BYTES)
+        self.assertEqual(self.stored_timestamps(replay_buffer), timestamps[-replay_buffer.capacity:])
+        self.assertEqual(replay_buffer.total_bytes, replay_buffer.capacity * FRAME_BYTES)
+
+    def test_oversized_and_out_of_order_frames_are_dropped(self):
+        replay_buffer = self.create_buffer(max_bytes=1024)
+        stored_at = []
+        on_stored = lambda stored_at_time, read_stored_frame: stored_at.append(stored_at_time)
+        replay_buffer._append(2.0, b"x" * FRAME_BYTES, on_stored)
+        replay_buffer._append(3.0, b"x" * 2048, on_stored)
+        replay_buffer._append(1.0, b"x" * FRAME_BYTES, on_stored)
+        self.assertEqual(self.stored_timestamps(replay_buffer), [2.0])
+        self.assertEqual(replay_buffer.total_bytes, FRAME_BYTES)
+        self.assertEqual(len(stored_at), 1)
+
+if __name__ == "__main__":
+    unittest.main()